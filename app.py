@@ -2,10 +2,12 @@ import eventlet
 eventlet.monkey_patch()
 import os
 from flask import Flask, request, jsonify, session
-from application.auth.auth import supabase
+from application.auth.auth import supabase, token_verifier
 from application.database.db import db
-from application.api.api import ShowsResource, ShowResource, EpisodesResource, EpisodeResource, UserResource, ChatResource , RatingResource, AchievementsResource, LeaderboardResource,GenerateScript, GenerateShow
+from application.api.api import ShowsResource, ShowResource, EpisodesResource, EpisodeResource, UserResource, ChatResource , RatingResource, AchievementsResource, LeaderboardResource,GenerateScript, GenerateShow, TelemetryResource, TimelineResource
 from application.api.socket import  setup_socket_handlers, active_stages
+from application.api.sessions import session_store
+from application.utils.serialization import FastJSONProvider, output_json, socketio_json
 from flask_cors import CORS
 from flask_restful import Api
 from flask_socketio import SocketIO,disconnect
@@ -29,7 +31,9 @@ logging.getLogger('requests').setLevel(logging.ERROR)  # Another HTTP client
 
 # instantiate the app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 web_api = Api(app)
+web_api.representations['application/json'] = output_json
 
 CORS(app, 
      resources={r"/*": {"origins": ["*"]}},
@@ -95,6 +99,7 @@ socketio = SocketIO(
     ping_interval=25,                      # Adjust ping interval
     max_http_buffer_size=10e6,             # Increase buffer size for large messages
     manage_session=True,                   # Let Socket.IO manage sessions
+    json=socketio_json,                    # orjson-backed packet encoding
 )
 
 # health check
@@ -129,19 +134,18 @@ def authenticate_socket():
         token = request.auth.get('token')
     
     if token:
-        try:
-            # Verify token with Supabase
-            user_response = supabase.auth.get_user(token)
-            if user_response and hasattr(user_response, 'user') and user_response.user:
-                # With the updated Supabase SDK, explicit authentication happens when we call get_user()
-                # We don't need to set anything else for authentication to work
-                return True
-        except Exception as e:
-            print(f"Socket auth error: {str(e)}")
+        # Verified locally against the project's JWT secret or JWKS, cached until the token expires
+        user = token_verifier.verify(token)
+        if not user:
+            print("Socket auth error: invalid token")
             return False
+        # later events are authorized from this session instead of the database
+        session_store.open(request.sid, user['id'])
+        return True
             
     # Allow connection for now, but individual handlers should check auth
     # You could return False here to reject unauthenticated connections
+    session_store.open(request.sid, None)
     return True
 
 @app.route("/auth/verify", methods=["POST"])
@@ -153,12 +157,10 @@ def auth_verify():
 
     try:
         # Get user from token
-        user_response = supabase.auth.get_user(token)
-        if not user_response:
+        user_data = token_verifier.verify(token)
+        if not user_data:
             return jsonify({"error": "Invalid token"}), 401
 
-        # Extract user from response
-        user = user_response.user if hasattr(user_response, 'user') else user_response
         session_data = {}
         try:
             session_response = supabase.auth.get_session()
@@ -172,8 +174,6 @@ def auth_verify():
             print(f"Error getting session info: {str(e)}")
             # Continue anyway, verification still worked
 
-        # Convert to a dict (if it's a Pydantic model)
-        user_data = user.dict() if hasattr(user, "dict") else user
         return jsonify({
             "message": "Login successful", 
             "user": user_data,
@@ -197,6 +197,8 @@ web_api.add_resource(AchievementsResource, '/api/achievements/<string:chat_id>')
 web_api.add_resource(LeaderboardResource, '/api/leaderboard')
 web_api.add_resource(GenerateScript, '/api/generate_script/<string:show_id>')
 web_api.add_resource(GenerateShow, '/api/generate_show')
+web_api.add_resource(TelemetryResource, '/api/telemetry', '/api/telemetry/<string:chat_id>')
+web_api.add_resource(TimelineResource, '/api/chats/<string:chat_id>/timeline')
 
 
 if __name__ == '__main__':
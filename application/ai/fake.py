@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Latency profiles: (seconds to first token, tokens per second after that; 0 = instant)
+FAKE_LLM_PROFILES = {
+    'instant': (0.0, 0),
+    'fast': (0.2, 200),
+    'realistic': (0.8, 60),
+    'slow': (2.5, 25),
+}
+FAKE_LLM_PROFILE = os.getenv('FAKE_LLM_PROFILE', 'realistic')
+# Overrides for the chosen profile, and the share of objective checks that pass
+FAKE_LLM_TTFT = os.getenv('FAKE_LLM_TTFT')
+FAKE_LLM_TOKENS_PER_SECOND = os.getenv('FAKE_LLM_TOKENS_PER_SECOND')
+FAKE_LLM_OBJECTIVE_PASS_RATE = float(os.getenv('FAKE_LLM_OBJECTIVE_PASS_RATE', '0.5'))
+
+_WORDS = ("well honestly we should probably talk about what happened last night before anyone "
+          "else finds out because this is getting out of hand and I am not sure how long we can "
+          "keep pretending everything is fine").split()
+
+
+def _sentence(rng, low=8, high=20):
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(low, high))]
+    return " ".join(words).capitalize() + "."
+
+
+def _cast(system_prompt):
+    """Character names from the director's system prompt"""
+    names = re.findall(r"'([^']+)': <application\.play\.actor\.Actor", system_prompt)
+    return names
+
+
+def _scripts(rng, cast, key, num_lines=5):
+    scripts = []
+    for _ in range(num_lines):
+        role = rng.choice(cast + ['Narration'])
+        if role == 'Narration':
+            scripts.append({'role': role, 'content': _sentence(rng)} if key == 'instruction'
+                           else {'role': role, 'line': _sentence(rng)})
+        else:
+            scripts.append({'role': role, key: _sentence(rng)})
+    return scripts
+
+
+def respond(messages):
+    """Deterministic reply for a prompt: schema-valid JSON for director and authoring prompts,
+    plain text for summaries and actor lines"""
+    system = messages[0].content if len(messages) > 1 else ''
+    prompt = messages[-1].content
+    rng = random.Random(hashlib.sha256(f"{system}\n{prompt}".encode()).hexdigest())
+
+    if 'Plot Objectives' in prompt:
+        data = {'episode_name': _sentence(rng, 2, 4), 'description': _sentence(rng), 'player_role': 'an old friend',
+                'background': _sentence(rng, 20, 40), 'plot_objectives': [_sentence(rng) for _ in range(6)]}
+    elif 'TV show metadata' in prompt:
+        data = {'name': _sentence(rng, 1, 3), 'description': _sentence(rng),
+                'characters': [{'name': f"Character {i + 1}", 'description': _sentence(rng)} for i in range(4)],
+                'relations': _sentence(rng, 20, 40)}
+    elif '"previous_outline"' in prompt:
+        data = {'previous_outline': _sentence(rng, 30, 60), 'new_outline': _sentence(rng, 30, 60)}
+    elif '"scripts"' in prompt and '"line"' in prompt:
+        data = {'planning': _sentence(rng), 'scripts': _scripts(rng, _cast(system), 'line')}
+    elif '"scripts"' in prompt:
+        data = {'planning': _sentence(rng), 'scripts': _scripts(rng, _cast(system), 'instruction')}
+    elif '"completed"' in prompt:
+        data = {'completed': rng.random() < FAKE_LLM_OBJECTIVE_PASS_RATE, 'reason': _sentence(rng),
+                'confidence': round(rng.uniform(0.5, 1.0), 2)}
+    elif '"achievements"' in prompt:
+        data = {'achievements': [{'title': _sentence(rng, 3, 6), 'reason': _sentence(rng), 'score': rng.randint(1, 5)}]
+                if rng.random() < 0.2 else [], 'confidence': round(rng.uniform(0.5, 1.0), 2)}
+    else:
+        return _sentence(rng, 30, 60) if 'running summary' in prompt else _sentence(rng)
+    return json.dumps(data)
+
+
+def _usage(messages, text):
+    input_tokens = sum(len(str(m.content)) for m in messages) // 4
+    output_tokens = len(text) // 4
+    return {'input_tokens': input_tokens, 'output_tokens': output_tokens, 'total_tokens': input_tokens + output_tokens}
+
+
+def _pieces(text):
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOpenAI used for load and latency testing (LLM_BACKEND=fake).
+    Replies are deterministic per prompt and paced by a latency profile; streaming is supported.
+    """
+    model_name: str = 'fake'
+    ttft: float = 0.0
+    tokens_per_second: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return 'fake-chat'
+
+    @property
+    def _identifying_params(self):
+        return {'model_name': self.model_name}
+
+    def _delays(self, text):
+        per_piece = 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+        return self.ttft, per_piece
+
+    def _result(self, messages, text):
+        usage = _usage(messages, text)
+        message = AIMessage(content=text, usage_metadata=usage)
+        token_usage = {'prompt_tokens': usage['input_tokens'], 'completion_tokens': usage['output_tokens'],
+                       'total_tokens': usage['total_tokens']}
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={'token_usage': token_usage, 'model_name': self.model_name})
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        text = respond(messages)
+        first, per_piece = self._delays(text)
+        time.sleep(first + per_piece * len(_pieces(text)))
+        return self._result(messages, text)
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        text = respond(messages)
+        first, per_piece = self._delays(text)
+        await asyncio.sleep(first + per_piece * len(_pieces(text)))
+        return self._result(messages, text)
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        text = respond(messages)
+        first, per_piece = self._delays(text)
+        time.sleep(first)
+        for index, piece in enumerate(_pieces(text)):
+            if index:
+                time.sleep(per_piece)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content='', usage_metadata=_usage(messages, text)))
+
+    async def _astream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        text = respond(messages)
+        first, per_piece = self._delays(text)
+        await asyncio.sleep(first)
+        for index, piece in enumerate(_pieces(text)):
+            if index:
+                await asyncio.sleep(per_piece)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content='', usage_metadata=_usage(messages, text)))
+
+
+def build_fake_llm(model, callbacks=None):
+    ttft, tokens_per_second = FAKE_LLM_PROFILES.get(FAKE_LLM_PROFILE, FAKE_LLM_PROFILES['realistic'])
+    if FAKE_LLM_TTFT is not None:
+        ttft = float(FAKE_LLM_TTFT)
+    if FAKE_LLM_TOKENS_PER_SECOND is not None:
+        tokens_per_second = float(FAKE_LLM_TOKENS_PER_SECOND)
+    return FakeChatModel(model_name=model, ttft=ttft, tokens_per_second=tokens_per_second, callbacks=callbacks)
@@ -0,0 +1,55 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+# Process-wide token-per-minute budget for model calls (0 disables the limit)
+LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', '0'))
+
+# Completion tokens reserved per call on top of the prompt estimate
+COMPLETION_TOKEN_ALLOWANCE = 500
+
+
+class LLMLimiter:
+    """
+    Token-per-minute limiter for model calls.
+    Lives on the LLM runtime's event loop, so every caller shares the same budget.
+    """
+    def __init__(self, tokens_per_minute=LLM_TOKENS_PER_MINUTE):
+        self.tokens_per_minute = tokens_per_minute
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.tokens_per_minute,
+                           self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60)
+        self._refilled_at = now
+
+    def try_take(self, prompt_tokens=0):
+        """Take the estimated tokens for a call only if the budget has them now; never waits"""
+        if not self.tokens_per_minute:
+            return True
+        tokens = min(prompt_tokens + COMPLETION_TOKEN_ALLOWANCE, self.tokens_per_minute)
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def _take_tokens(self, tokens):
+        if not self.tokens_per_minute:
+            return
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self._tokens) * 60 / self.tokens_per_minute)
+
+    @asynccontextmanager
+    async def slot(self, prompt_tokens=0):
+        """Take the estimated tokens for a call before it starts"""
+        await self._take_tokens(prompt_tokens + COMPLETION_TOKEN_ALLOWANCE)
+        yield
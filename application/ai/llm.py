@@ -1,14 +1,46 @@
 from langchain_openai import ChatOpenAI
+from application.ai.telemetry import llm_telemetry
+from application.ai.routing import ModelRouter
 import os
 
-actor_llm = ChatOpenAI(
-    model_name="gpt-4.1-mini-2025-04-14",
+# 'openai' for real model calls, 'fake' for the deterministic offline backend used in load tests
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai').lower()
+
+
+def build_llm(model, **kwargs):
+    """Create a chat model client that reports every call to llm_telemetry"""
+    if LLM_BACKEND == 'fake':
+        from application.ai.fake import build_fake_llm
+        return build_fake_llm(model, callbacks=[llm_telemetry])
+    kwargs.setdefault('stream_usage', True)
+    return ChatOpenAI(model=model, callbacks=[llm_telemetry], **kwargs)
+
+
+actor_llm = build_llm(
+    "gpt-4.1-mini-2025-04-14",
     temperature=0.5,
     api_key=os.getenv('OPENAI_API_KEY')
 )
 
-director_llm = ChatOpenAI(
-    model_name="gpt-4.1-2025-04-14",
+director_llm = build_llm(
+    "gpt-4.1-2025-04-14",
+    temperature=0.3,
+    api_key=os.getenv('OPENAI_API_KEY')
+)
+
+
+# Cheap tier for easy Director tasks (objective checks, achievements, summaries), see routing.py
+director_fast_llm = build_llm(
+    os.getenv('DIRECTOR_FAST_MODEL', "gpt-4.1-mini-2025-04-14"),
     temperature=0.3,
     api_key=os.getenv('OPENAI_API_KEY')
 )
+
+
+def fallback_for(llm):
+    """Cheaper model a call falls back to when `llm` keeps failing or its circuit is open"""
+    return actor_llm if llm is director_llm else None
+
+
+
+model_router = ModelRouter({'fast': director_fast_llm})
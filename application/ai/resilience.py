@@ -0,0 +1,237 @@
+import asyncio
+import os
+import random
+import time
+from collections import Counter, defaultdict, deque
+import openai
+from langchain_core.exceptions import OutputParserException
+
+# Per-call deadline in seconds
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', '90'))
+# Streams: longest wait for any chunk after the first, and deadline for the whole response
+LLM_STREAM_CHUNK_TIMEOUT = float(os.getenv('LLM_STREAM_CHUNK_TIMEOUT', '30'))
+LLM_STREAM_DEADLINE = float(os.getenv('LLM_STREAM_DEADLINE', '300'))
+# Hedged duplicates: fire a second request once a call outlives its call site's p95 latency
+LLM_HEDGE = os.getenv('LLM_HEDGE', 'True').lower() == 'true'
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '2'))
+LLM_HEDGE_MIN_SAMPLES = 20
+# Retries for transient errors, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5'))
+# Circuit breaker per model: opens after this many consecutive failures, probes again after the reset time
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', '30'))
+
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    OutputParserException,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a model's circuit breaker is open and no fallback is available"""
+
+
+def _model_of(chain):
+    for step in getattr(chain, 'steps', [chain]):
+        name = getattr(step, 'model_name', None)
+        if name:
+            return name
+    return 'unknown'
+
+
+def _call_site(config):
+    return ((config or {}).get('metadata') or {}).get('call_site', 'unknown')
+
+
+class CircuitBreaker:
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset_after=LLM_BREAKER_RESET):
+        self.max_failures = failures
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_after else 'open'
+
+    def allow(self):
+        return self.state != 'open'
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        """Returns True when this failure opens the breaker"""
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            was_open = self.opened_at is not None
+            self.opened_at = time.monotonic()
+            return not was_open
+        return False
+
+
+class Resilience:
+    """
+    Deadlines, hedged requests, jittered retries and per-model circuit breakers with
+    fallback to a cheaper chain. Runs on the LLM runtime loop; counters are kept per call site.
+    """
+    def __init__(self):
+        self.breakers = defaultdict(CircuitBreaker)
+        self.latencies = defaultdict(lambda: deque(maxlen=200))
+        self.metrics = defaultdict(Counter)
+
+    def hedge_delay(self, call_site):
+        samples = self.latencies[call_site]
+        if not LLM_HEDGE or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return max(LLM_HEDGE_MIN_DELAY, ordered[int(0.95 * (len(ordered) - 1))])
+
+    def _targets(self, chain, fallback, call_site):
+        """Chains to try in order, skipping any whose model's breaker is open"""
+        targets = [c for c in (chain, fallback) if c is not None and self.breakers[_model_of(c)].allow()]
+        if not targets:
+            self.metrics[call_site]['rejected'] += 1
+            raise CircuitOpenError(f"Circuit open for {_model_of(chain)}")
+        if targets[0] is not chain:
+            self.metrics[call_site]['fallbacks'] += 1
+        return targets
+
+    def _failed(self, target, call_site, error):
+        metrics = self.metrics[call_site]
+        metrics['timeouts' if isinstance(error, asyncio.TimeoutError) else 'errors'] += 1
+        if self.breakers[_model_of(target)].record_failure():
+            metrics['breaker_opened'] += 1
+
+    async def _backoff(self, attempt, call_site):
+        self.metrics[call_site]['retries'] += 1
+        await asyncio.sleep(random.uniform(0, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+    async def _hedge(self, run, target, release):
+        try:
+            return await run(target)
+        finally:
+            release()
+
+    async def _race(self, run, target, call_site, admit_hedge):
+        """
+        Run the call, adding one hedged duplicate if it outlives the p95 delay; first success wins.
+        admit_hedge() admits the duplicate without waiting and returns the function that
+        releases its admission, or None to skip the hedge.
+        """
+        tasks = [asyncio.ensure_future(run(target))]
+        delay = self.hedge_delay(call_site)
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                release = admit_hedge() if not done else None
+                if release is not None:
+                    self.metrics[call_site]['hedges'] += 1
+                    tasks.append(asyncio.ensure_future(self._hedge(run, target, release)))
+                elif not done:
+                    self.metrics[call_site]['hedges_skipped'] += 1
+            pending = list(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.metrics[call_site]['hedges_won'] += 1
+                        return task.result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, run, chain, fallback=None, config=None, admit_hedge=lambda: None):
+        """Await run(chain) with deadline, hedging and retries, falling back to run(fallback)"""
+        call_site = _call_site(config)
+        error = None
+        for target in self._targets(chain, fallback, call_site):
+            if target is not chain and error:
+                self.metrics[call_site]['fallbacks'] += 1
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                started = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(self._race(run, target, call_site, admit_hedge), LLM_DEADLINE)
+                except TRANSIENT_ERRORS as e:
+                    error = e
+                    self._failed(target, call_site, e)
+                    if attempt < LLM_MAX_RETRIES and self.breakers[_model_of(target)].allow():
+                        await self._backoff(attempt, call_site)
+                        continue
+                    break
+                self.breakers[_model_of(target)].record_success()
+                self.latencies[call_site].append(time.monotonic() - started)
+                return result
+        raise error
+
+    @staticmethod
+    async def _close(iterator):
+        try:
+            await iterator.aclose()
+        except Exception:
+            pass
+
+    async def stream(self, run_stream, chain, fallback=None, config=None):
+        """
+        Stream from run_stream(chain); retries and fallback apply until the first chunk arrives.
+        After that each chunk must arrive within LLM_STREAM_CHUNK_TIMEOUT and the whole
+        response within LLM_STREAM_DEADLINE, or the stream is closed and TimeoutError raised.
+        """
+        call_site = _call_site(config)
+        error = None
+        for target in self._targets(chain, fallback, call_site):
+            if target is not chain and error:
+                self.metrics[call_site]['fallbacks'] += 1
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                iterator = run_stream(target).__aiter__()
+                deadline = time.monotonic() + LLM_STREAM_DEADLINE
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), LLM_DEADLINE)
+                except StopAsyncIteration:
+                    self.breakers[_model_of(target)].record_success()
+                    return
+                except TRANSIENT_ERRORS as e:
+                    await self._close(iterator)
+                    error = e
+                    self._failed(target, call_site, e)
+                    if attempt < LLM_MAX_RETRIES and self.breakers[_model_of(target)].allow():
+                        await self._backoff(attempt, call_site)
+                        continue
+                    break
+                self.breakers[_model_of(target)].record_success()
+                try:
+                    yield chunk
+                    while True:
+                        timeout = min(LLM_STREAM_CHUNK_TIMEOUT, deadline - time.monotonic())
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), max(timeout, 0))
+                        except StopAsyncIteration:
+                            return
+                        except asyncio.TimeoutError as e:
+                            # a stalled stream can't be retried once chunks went out
+                            self.metrics[call_site]['stalls'] += 1
+                            self._failed(target, call_site, e)
+                            raise
+                        yield chunk
+                finally:
+                    await self._close(iterator)
+        raise error
+
+    def snapshot(self):
+        """Counters per call site and breaker state per model, for the telemetry endpoint"""
+        return {
+            'call_sites': {site: dict(counts) for site, counts in list(self.metrics.items())},
+            'breakers': {model: {'state': b.state, 'failures': b.failures} for model, b in list(self.breakers.items())},
+            'hedge_delays': {site: self.hedge_delay(site) for site in list(self.latencies)},
+        }
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from pydantic import ValidationError
+from application.ai.telemetry import _percentile
+
+# Model tier per Director task: 'fast' tasks run on the cheap model and escalate to 'strong' when unsure
+DIRECTOR_ROUTES = {
+    'generate_outline': 'strong',
+    'generate_turn_instructions': 'strong',
+    'generate_ensemble_scene': 'strong',
+    'check_objective': 'fast',
+    'detect_achievements': 'fast',
+    'summarize_context': 'fast',
+}
+# Overrides as "task=tier,task=tier", e.g. DIRECTOR_ROUTES="check_objective=strong"
+for _route in filter(None, os.getenv('DIRECTOR_ROUTES', '').split(',')):
+    _task, _, _tier = _route.partition('=')
+    DIRECTOR_ROUTES[_task.strip()] = _tier.strip()
+# Fast-tier answers below this self-reported confidence are re-run on the strong tier
+DIRECTOR_ESCALATION_CONFIDENCE = float(os.getenv('DIRECTOR_ESCALATION_CONFIDENCE', '0.7'))
+
+
+class ModelRouter:
+    """
+    Sends each Director task to its configured model tier. A fast-tier call escalates to the
+    strong model when it errors, its output fails schema validation, or it reports low confidence.
+    Keeps per-route call and escalation counts and latency samples for the telemetry endpoint.
+    """
+    def __init__(self, tiers, routes=DIRECTOR_ROUTES, threshold=DIRECTOR_ESCALATION_CONFIDENCE):
+        self.tiers = tiers
+        self.routes = routes
+        self.threshold = threshold
+        self.metrics = defaultdict(Counter)
+        self.latencies = defaultdict(lambda: deque(maxlen=200))
+        self._lock = threading.Lock()
+
+    def tier(self, task):
+        tier = self.routes.get(task, 'strong')
+        return tier if tier in self.tiers else 'strong'
+
+    def _escalation_reason(self, result, schema):
+        if schema is None:
+            return None
+        try:
+            validated = schema.model_validate(result)
+        except ValidationError:
+            return 'schema'
+        confidence = getattr(validated, 'confidence', None)
+        if confidence is not None and confidence < self.threshold:
+            return 'low_confidence'
+        return None
+
+    def _record(self, task, tier, started, **counts):
+        with self._lock:
+            self.latencies[(task, tier)].append(time.monotonic() - started)
+            self.metrics[task].update(counts)
+
+    def route(self, task, run, strong_llm, schema=None):
+        """Return run(llm) on the task's tier, re-running on strong_llm if the fast answer is not usable"""
+        tier = self.tier(task)
+        if tier == 'strong':
+            started = time.monotonic()
+            result = run(strong_llm)
+            self._record(task, tier, started, calls=1)
+            return result
+
+        started = time.monotonic()
+        try:
+            result = run(self.tiers[tier])
+            reason = self._escalation_reason(result, schema)
+        except Exception as e:
+            print(f"Fast route for {task} failed, escalating: {e}")
+            reason = 'error'
+        if reason is None:
+            self._record(task, tier, started, calls=1)
+            return result
+        self._record(task, tier, started, calls=1, escalations=1, **{f'escalated_{reason}': 1})
+
+        started = time.monotonic()
+        result = run(strong_llm)
+        self._record(task, 'strong', started)
+        return result
+
+    def snapshot(self):
+        """Route, escalation rate and latency percentiles per task"""
+        with self._lock:
+            routes = {}
+            for task in set(self.routes) | set(self.metrics):
+                counts = dict(self.metrics.get(task, {}))
+                calls = counts.get('calls', 0)
+                routes[task] = {
+                    'tier': self.tier(task),
+                    **counts,
+                    'escalation_rate': counts.get('escalations', 0) / calls if calls else None,
+                    'latency': {tier: {'count': len(samples),
+                                       'p50': _percentile(list(samples), 50),
+                                       'p95': _percentile(list(samples), 95)}
+                                for (name, tier), samples in self.latencies.items() if name == task},
+                }
+            return routes
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import queue
+import threading
+from application.ai.limiter import LLMLimiter
+from application.ai.scheduler import LLMScheduler, PRIORITY_TURN
+from application.ai.resilience import Resilience
+
+# Under eventlet the runtime needs a native thread for its event loop. Green callers wait
+# for its results on a pipe watched by the hub, so a wait holds no native thread and the
+# number of calls in flight is bounded by the scheduler alone.
+try:
+    import eventlet.patcher
+    from eventlet.hubs import trampoline
+    _green = eventlet.patcher.is_monkey_patched('thread')
+except ImportError:
+    _green = False
+
+if _green:
+    _threading = eventlet.patcher.original('threading')
+    _queue = eventlet.patcher.original('queue')
+    _os = eventlet.patcher.original('os')
+else:
+    _threading, _queue, _os = threading, queue, os
+
+
+class _Channel:
+    """
+    Hands items from the runtime loop thread to one synchronous caller. Under eventlet every
+    put also writes a byte to a pipe, and the caller waits for it through the hub instead of
+    blocking a native thread.
+    """
+    def __init__(self):
+        self.items = _queue.Queue()
+        self.closed = False
+        self._r, self._w = _os.pipe() if _green else (None, None)
+        self._lock = _threading.Lock()
+
+    def put(self, item):
+        # a put racing close() must not write to a closed (and possibly reused) descriptor
+        with self._lock:
+            if self.closed:
+                return
+            self.items.put(item)
+            if _green:
+                _os.write(self._w, b'.')
+
+    def get(self):
+        if not _green:
+            return self.items.get()
+        while True:
+            try:
+                return self.items.get_nowait()
+            except _queue.Empty:
+                trampoline(self._r, read=True)
+                _os.read(self._r, 4096)
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            if _green:
+                _os.close(self._r)
+                _os.close(self._w)
+
+
+def _admission(config):
+    """Priority and fairness key of a call, taken from its call_config metadata"""
+    metadata = (config or {}).get('metadata') or {}
+    return metadata.get('priority', PRIORITY_TURN), metadata.get('user_id') or metadata.get('chat_id')
+
+
+class LLMRuntime:
+    """
+    A single asyncio event loop that runs every Actor and Director model call with
+    ainvoke/astream. Calls are admitted by one shared LLMScheduler (concurrency, priority
+    and per-user fairness) and LLMLimiter (tokens per minute), and run under Resilience
+    (deadlines, hedging, retries, circuit breakers with an optional fallback chain).
+    Synchronous callers (stage turn threads, API resources) use invoke() and stream(),
+    which hand the call to the loop and wait for the result.
+    """
+    def __init__(self):
+        self._loop = None
+        self._limiter = None
+        self._scheduler = None
+        self.resilience = Resilience()
+        self._lock = _threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                _threading.Thread(target=loop.run_forever, name='llm-runtime', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    # scheduler and limiter are created lazily on the runtime loop
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = LLMLimiter()
+        return self._limiter
+
+    @property
+    def scheduler(self):
+        if self._scheduler is None:
+            self._scheduler = LLMScheduler()
+        return self._scheduler
+
+    def submit(self, coro):
+        """Schedule a coroutine on the runtime loop and return a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """Run a coroutine on the loop and wait for its result"""
+        future = self.submit(coro)
+        if not _green:
+            return future.result()
+        channel = _Channel()
+        try:
+            future.add_done_callback(channel.put)
+            return channel.get().result()
+        finally:
+            channel.close()
+
+    def _admit_hedge(self, config, prompt_tokens):
+        """
+        Admit a hedged duplicate like any other call, but only if a scheduler slot and the
+        limiter's tokens are free right now; returns the slot's release, or None to skip it
+        """
+        _, user_id = _admission(config)
+        if not self.scheduler.try_acquire(user_id):
+            return None
+        if not self.limiter.try_take(prompt_tokens):
+            self.scheduler.release(user_id)
+            return None
+        return lambda: self.scheduler.release(user_id)
+
+    async def ainvoke(self, chain, config=None, prompt_tokens=0, fallback=None):
+        async with self.scheduler.slot(*_admission(config)), self.limiter.slot(prompt_tokens):
+            return await self.resilience.call(lambda c: c.ainvoke({}, config=config), chain, fallback, config,
+                                              lambda: self._admit_hedge(config, prompt_tokens))
+
+    async def astream(self, chain, config=None, prompt_tokens=0, fallback=None):
+        async with self.scheduler.slot(*_admission(config)), self.limiter.slot(prompt_tokens):
+            async for chunk in self.resilience.stream(lambda c: c.astream({}, config=config),
+                                                      chain, fallback, config):
+                yield chunk
+
+    def invoke(self, chain, config=None, prompt_tokens=0, fallback=None):
+        return self.run(self.ainvoke(chain, config, prompt_tokens, fallback))
+
+    def stream(self, chain, config=None, prompt_tokens=0, fallback=None):
+        """Iterate over astream chunks from a synchronous caller"""
+        chunks = _Channel()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(chain, config, prompt_tokens, fallback):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # a caller that stops early also stops the model call
+            future.cancel()
+            chunks.close()
+
+
+# Process-wide runtime shared by every stage
+llm_runtime = LLMRuntime()
@@ -0,0 +1,94 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+# Priority classes, most urgent first
+PRIORITY_INTERRUPT = 0   # replanning after a player interrupt
+PRIORITY_TURN = 1        # outlines, turn instructions and actor lines of a normal turn
+PRIORITY_OBJECTIVE = 2   # objective checks and speculative outlines
+PRIORITY_BACKGROUND = 3  # achievements and authoring endpoints
+
+# Process-wide cap on in-flight model calls
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '32'))
+# A waiting request is promoted one priority class per this many seconds, so background work can't starve
+LLM_PRIORITY_AGING = float(os.getenv('LLM_PRIORITY_AGING', '30'))
+
+
+class LLMScheduler:
+    """
+    Admission control for model calls on the LLM runtime loop.
+    When all slots are busy, a freed slot goes to the waiting request with the best
+    (aged) priority; within a priority class, to the user with the fewest calls in flight,
+    then first come first served.
+    """
+    def __init__(self, capacity=LLM_MAX_CONCURRENCY, aging=LLM_PRIORITY_AGING):
+        self.capacity = capacity
+        self.aging = aging
+        self.in_flight = 0
+        self.in_flight_by_user = defaultdict(int)
+        self._waiting = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self):
+        return len(self._waiting)
+
+    def _rank(self, waiter, now):
+        priority, seq, user_id, enqueued_at, _ = waiter
+        aged = priority - int((now - enqueued_at) / self.aging) if self.aging else priority
+        return aged, self.in_flight_by_user[user_id], seq
+
+    def _grant(self, user_id):
+        self.in_flight += 1
+        self.in_flight_by_user[user_id] += 1
+
+    def try_acquire(self, user_id=None):
+        """Take a slot only if one is free and nobody is waiting; never queues"""
+        if self.in_flight < self.capacity and not self._waiting:
+            self._grant(user_id)
+            return True
+        return False
+
+    def release(self, user_id=None):
+        self.in_flight -= 1
+        self.in_flight_by_user[user_id] -= 1
+        if self.in_flight_by_user[user_id] <= 0:
+            del self.in_flight_by_user[user_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._waiting and self.in_flight < self.capacity:
+            waiter = min(self._waiting, key=lambda w: self._rank(w, now))
+            self._waiting.remove(waiter)
+            future = waiter[4]
+            if future.done():
+                continue
+            self._grant(waiter[2])
+            future.set_result(None)
+
+    async def _acquire(self, priority, user_id):
+        if self.try_acquire(user_id):
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiter = (priority, next(self._seq), user_id, time.monotonic(), future)
+        self._waiting.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            elif future.done() and not future.cancelled():
+                self.release(user_id)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, priority=PRIORITY_TURN, user_id=None):
+        await self._acquire(priority, user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id)
@@ -0,0 +1,143 @@
+import os
+import time
+import threading
+from collections import deque
+from langchain_core.callbacks import BaseCallbackHandler
+
+# USD per million tokens: (prompt, completion)
+MODEL_PRICES = {
+    'gpt-4.1-2025-04-14': (2.00, 8.00),
+    'gpt-4.1-mini-2025-04-14': (0.40, 1.60),
+    'gpt-4o': (2.50, 10.00),
+    'o4-mini': (1.10, 4.40),
+}
+
+# How many finished calls are kept in memory for querying
+TELEMETRY_MAX_RECORDS = int(os.getenv('TELEMETRY_MAX_RECORDS', '20000'))
+
+
+def call_config(call_site, chat_id=None, **metadata):
+    """Runnable config that tags a model call with its call site and chat for telemetry"""
+    return {"run_name": call_site, "metadata": {"call_site": call_site, "chat_id": chat_id, **metadata}}
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class LLMTelemetry(BaseCallbackHandler):
+    """
+    Callback handler recording one record per model call:
+    call site, chat_id, model, prompt/completion tokens, wall time, time-to-first-token and cost.
+    """
+    # the hooks only update counters, so async calls run them on the loop instead of an executor thread per event
+    run_inline = True
+
+    def __init__(self, max_records=TELEMETRY_MAX_RECORDS):
+        self.records = deque(maxlen=max_records)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    # ---- Callback hooks ----
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, invocation_params=None, **kwargs):
+        self._start(run_id, metadata, invocation_params)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, invocation_params=None, **kwargs):
+        self._start(run_id, metadata, invocation_params)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        pending = self._pending.get(run_id)
+        if pending and pending['first_token_at'] is None:
+            pending['first_token_at'] = time.time()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = self._usage(response)
+        self._finish(run_id, prompt_tokens, completion_tokens, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, 0, 0, str(error))
+
+    def _start(self, run_id, metadata, invocation_params):
+        metadata = metadata or {}
+        params = invocation_params or {}
+        self._pending[run_id] = {
+            'call_site': metadata.get('call_site', 'unknown'),
+            'chat_id': metadata.get('chat_id'),
+            'model': metadata.get('ls_model_name') or params.get('model') or params.get('model_name'),
+            'started_at': time.time(),
+            'first_token_at': None,
+        }
+
+    def _usage(self, response):
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        if usage:
+            return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)
+        # streamed calls report usage on the final message instead
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, 'message', None)
+                usage = getattr(message, 'usage_metadata', None)
+                if usage:
+                    return usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+        return 0, 0
+
+    def _finish(self, run_id, prompt_tokens, completion_tokens, error):
+        pending = self._pending.pop(run_id, None)
+        if not pending:
+            return
+        ended_at = time.time()
+        first_token_at = pending.pop('first_token_at') or ended_at
+        prompt_price, completion_price = MODEL_PRICES.get(pending['model'], (0.0, 0.0))
+        record = {
+            **pending,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'latency': ended_at - pending['started_at'],
+            'ttft': first_token_at - pending['started_at'],
+            'cost': (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000,
+            'error': error,
+        }
+        with self._lock:
+            self.records.append(record)
+
+    # ---- Queries ----
+
+    def for_chat(self, chat_id):
+        """All recorded calls for a chat, oldest first"""
+        with self._lock:
+            return [r for r in self.records if r['chat_id'] == chat_id]
+
+    def summary(self, records=None, group_by='call_site'):
+        """Aggregate calls by `group_by` (call_site, model or chat_id)"""
+        if records is None:
+            with self._lock:
+                records = list(self.records)
+        groups = {}
+        for record in records:
+            groups.setdefault(record.get(group_by) or 'unknown', []).append(record)
+
+        summary = {}
+        for key, items in groups.items():
+            latencies = [r['latency'] for r in items]
+            ttfts = [r['ttft'] for r in items]
+            summary[key] = {
+                'calls': len(items),
+                'errors': sum(1 for r in items if r['error']),
+                'prompt_tokens': sum(r['prompt_tokens'] for r in items),
+                'completion_tokens': sum(r['completion_tokens'] for r in items),
+                'cost': round(sum(r['cost'] for r in items), 6),
+                'latency_avg': sum(latencies) / len(latencies),
+                'latency_p50': _percentile(latencies, 50),
+                'latency_p95': _percentile(latencies, 95),
+                'ttft_p50': _percentile(ttfts, 50),
+                'ttft_p95': _percentile(ttfts, 95),
+            }
+        return summary
+
+
+# Process-wide collector attached to every model client
+llm_telemetry = LLMTelemetry()
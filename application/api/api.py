@@ -2,11 +2,16 @@ from flask_restful import Resource, Api, marshal_with, fields, reqparse, marshal
 from flask import request, jsonify, g, Response, session
 from application.database.db import db
 from application.auth.auth import get_current_user
-from application.ai.llm import director_llm
+from application.ai.llm import director_llm, build_llm, model_router
+from application.ai.telemetry import llm_telemetry, call_config
+from application.ai.runtime import llm_runtime
+from application.ai.scheduler import PRIORITY_BACKGROUND
+from application.play.stage import STAGE_MODES
+from application.play.tracing import stage_tracer
+from application.jobs.jobs import job_queue
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from langchain_core.output_parsers import JsonOutputParser
-from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from tvdb_v4_official import TVDB
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -16,6 +21,9 @@ import os
 import uuid
 import json
 
+# Users allowed to read process-wide telemetry (comma-separated user ids); everyone else only sees their own chats
+TELEMETRY_ADMIN_USERS = {user.strip() for user in os.getenv('TELEMETRY_ADMIN_USERS', '').split(',') if user.strip()}
+
 class UserResource(Resource):
 
     def get(self):
@@ -418,6 +426,9 @@ class ChatResource(Resource):
         player_name = data.get('player_name', 'Player')
         player_description = data.get('player_description', '')
         chat_speed = data.get('chat_speed', 2.25)
+        stage_mode = data.get('stage_mode')
+        if stage_mode and stage_mode not in STAGE_MODES:
+            return {"error": f"stage_mode must be one of {', '.join(STAGE_MODES)}"}, 400
         # Fetch episode details
         episode = db.get_episode(episode_id)
         if not episode:
@@ -430,7 +441,8 @@ class ChatResource(Resource):
             user_id=user_id,
             player_name=player_name,
             player_description=player_description,
-            chat_speed=chat_speed
+            chat_speed=chat_speed,
+            stage_mode=stage_mode
         )
         
         if not chat:
@@ -515,6 +527,49 @@ class LeaderboardResource(Resource):
         leaderboard = db.get_all_users()
         return jsonify({"leaderboard": leaderboard})
     
+class TelemetryResource(Resource):
+    def get(self, chat_id=None):
+        """LLM call telemetry of one of the user's chats, or aggregated across the process for telemetry admins"""
+        user_id = get_current_user()
+        if not user_id:
+            return {"error": "Unauthorized. Please login again"}, 401
+
+        if chat_id:
+            chat = db.get_chat(chat_id)
+            if not chat:
+                return {"error": "Chat not found"}, 404
+            if chat.get('user_id') != user_id:
+                return {"error": "Not authorized to access this chat"}, 403
+            calls = llm_telemetry.for_chat(chat_id)
+            return jsonify({"calls": calls, "summary": llm_telemetry.summary(calls)})
+
+        if user_id not in TELEMETRY_ADMIN_USERS:
+            return {"error": "Not authorized to access process telemetry"}, 403
+        group_by = request.args.get('group_by', 'call_site')
+        if group_by not in ('call_site', 'model', 'chat_id'):
+            return {"error": "group_by must be one of call_site, model, chat_id"}, 400
+        return jsonify({"summary": llm_telemetry.summary(group_by=group_by),
+                        "resilience": llm_runtime.resilience.snapshot(),
+                        "routing": model_router.snapshot(),
+                        "jobs": job_queue.stats()})
+
+class TimelineResource(Resource):
+    def get(self, chat_id):
+        """Recent stage trace spans of a chat (turns, lines, objective checks, saves), oldest first"""
+        user_id = get_current_user()
+        if not user_id:
+            return {"error": "Unauthorized. Please login again"}, 401
+        chat = db.get_chat(chat_id)
+        if not chat:
+            return {"error": "Chat not found"}, 404
+        if chat.get('user_id') != user_id:
+            return {"error": "Not authorized to access this chat"}, 403
+        try:
+            limit = int(request.args.get('turns', 10))
+        except ValueError:
+            return {"error": "turns must be an integer"}, 400
+        return jsonify({"spans": stage_tracer.timeline(chat_id, limit)})
+
 class GenerateScript(Resource):
     def post(self,show_id):
         user_id = get_current_user()
@@ -570,14 +625,14 @@ class GenerateScript(Resource):
             "effort": "medium",  # 'low', 'medium', or 'high'
         }
 
-        llm = ChatOpenAI(
-            model="o4-mini",
+        llm = build_llm(
+            "o4-mini",
             use_responses_api=True,
             model_kwargs={"reasoning": reasoning},
         )
         prompt_template = PromptTemplate.from_template(prompt) 
         chain = prompt_template | llm | script_parser
-        script = chain.invoke({})
+        script = llm_runtime.invoke(chain, call_config('api.generate_script', user_id=user_id, priority=PRIORITY_BACKGROUND, show_id=show_id))
         return jsonify({"script": script})
     
 class GenerateShow(Resource):
@@ -606,10 +661,10 @@ class GenerateShow(Resource):
             Show name: {show_name}
         """
         template = PromptTemplate.from_template(prompt)
-        llm = ChatOpenAI(model_name="gpt-4o", temperature=0.7)
+        llm = build_llm("gpt-4o", temperature=0.7)
 
         try:
-            raw = (template | llm).invoke({}).content.strip()
+            raw = llm_runtime.invoke(template | llm, call_config('api.generate_show', priority=PRIORITY_BACKGROUND)).content.strip()
         except Exception as e:
             return {"error": "Failed to generate metadata."}, 502
 
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from collections import deque
+
+# Sliding-window limits per connection: at most N events of a kind every `window` seconds
+SOCKET_INPUT_LIMIT = int(os.getenv('SOCKET_INPUT_LIMIT', '10'))
+SOCKET_JOIN_LIMIT = int(os.getenv('SOCKET_JOIN_LIMIT', '20'))
+SOCKET_RATE_WINDOW = float(os.getenv('SOCKET_RATE_WINDOW', '10'))
+
+
+class ConnectionSession:
+    """What the server knows about one Socket.IO connection: its user, the chats it has joined
+    (ownership verified at join time) and its recent event times for rate limiting"""
+    def __init__(self, sid, user_id):
+        self.sid = sid
+        self.user_id = user_id
+        self.connected_at = time.time()
+        self.chats = set()
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def allow(self, event, limit, window=SOCKET_RATE_WINDOW):
+        """Count an event; False if the connection already sent `limit` of them within `window` seconds"""
+        now = time.time()
+        with self._lock:
+            times = self._events.setdefault(event, deque())
+            while times and times[0] <= now - window:
+                times.popleft()
+            if len(times) >= limit:
+                return False
+            times.append(now)
+            return True
+
+
+class SessionStore:
+    """Connection sessions by sid, opened at connect and closed at disconnect"""
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def open(self, sid, user_id):
+        session = ConnectionSession(sid, user_id)
+        with self._lock:
+            self._sessions[sid] = session
+        return session
+
+    def get(self, sid):
+        return self._sessions.get(sid)
+
+    def close(self, sid):
+        """Remove and return the session of a disconnected sid, or None"""
+        with self._lock:
+            return self._sessions.pop(sid, None)
+
+    def watching(self, chat_id):
+        """Whether any open connection has joined the chat"""
+        with self._lock:
+            return any(chat_id in session.chats for session in self._sessions.values())
+
+
+session_store = SessionStore()
@@ -1,8 +1,12 @@
-import time, threading, logging, schedule
+import time, threading, logging
 from flask import request
 from flask_socketio import join_room, leave_room
 from application.database.db import db
-from application.play.stage import Stage
+from application.play.stage import Stage, detect_player_achievements
+from application.jobs.jobs import job_queue
+from application.api.sessions import session_store, SOCKET_INPUT_LIMIT, SOCKET_JOIN_LIMIT
+from application.play.runtime import stage_runtime
+from application.play.hibernation import stage_hibernator, STAGE_IDLE_SECONDS, STAGE_MAX_RESIDENT
 
 logger = logging.getLogger("SocketHandlers")
 active_stages = {}
@@ -20,14 +24,22 @@ def setup_socket_handlers(socketio):
     Stage.__setattr__ = tracking_setattr
     
     # Start monitoring for stuck processes
-    def run_scheduler():
-        schedule.every(5).minutes.do(lambda: monitor_active_stages(socketio))
-        schedule.every(30).minutes.do(cleanup_inactive_stages)
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
-    threading.Thread(target=run_scheduler, daemon=True).start()
+    stage_runtime.call_every(5 * 60, monitor_active_stages, socketio)
+    stage_runtime.call_every(30 * 60, cleanup_inactive_stages)
+    stage_runtime.call_every(60, hibernate_idle_stages)
     logger.info("Stage monitoring started")
+
+    @job_queue.handler('detect_achievements')
+    def handle_detect_achievements(payload):
+        chat_id = payload['chat_id']
+        new_achievements = detect_player_achievements(payload)
+        with active_stages_lock:
+            stage = active_stages.get(chat_id)
+        if stage:
+            stage.achievements.extend(new_achievements)
+        for achievement in new_achievements:
+            socketio.emit('achievement', achievement, room=chat_id)
+    job_queue.start()
     socketio.cleanup_inactive_stages = cleanup_inactive_stages
     socketio.monitor_active_stages = lambda: monitor_active_stages(socketio)
 
@@ -36,16 +48,16 @@ def setup_socket_handlers(socketio):
         """Handle client disconnection"""
         logger.info(f"Client disconnected: {request.sid}")
         try:
-            client_rooms = getattr(request, 'rooms', set())
-            if request.sid in client_rooms: client_rooms.remove(request.sid)
+            session = session_store.close(request.sid)
+            client_rooms = session.chats if session else set()
             stopped_chats = []
             for chat_id in client_rooms:
                 with active_stages_lock:
-                    if chat_id in active_stages:
+                    # another connection (e.g. a second tab) is still playing this chat
+                    if chat_id in active_stages and not session_store.watching(chat_id):
                         try:
                             logger.info(f"Stopping stage for chat_id={chat_id}")
-                            active_stages[chat_id]._cancel_all_operations()
-                            active_stages.pop(chat_id)
+                            stop_stage(chat_id)
                             stopped_chats.append(chat_id)
                         except Exception as e:
                             logger.error(f"Error stopping stage: {str(e)}", exc_info=True)
@@ -68,11 +80,15 @@ def setup_socket_handlers(socketio):
                 socketio.emit('error', {'message': 'No chat ID provided'}, room=request.sid)
                 return
             logger.info(f"Client {request.sid} leaving chat: {chat_id}")
+            session = session_store.get(request.sid)
+            if not session or chat_id not in session.chats:
+                leave_room(chat_id)
+                return
+            session.chats.discard(chat_id)
             with active_stages_lock:
-                if chat_id in active_stages:
+                if chat_id in active_stages and not session_store.watching(chat_id):
                     logger.info(f"Stopping stage for chat_id={chat_id}")
-                    active_stages[chat_id]._cancel_all_operations()
-                    active_stages.pop(chat_id)
+                    stop_stage(chat_id)
                     socketio.emit('status', {'message': 'Chat stopped as you left'}, room=chat_id)
             leave_room(chat_id)
         except Exception as e:
@@ -84,37 +100,65 @@ def setup_socket_handlers(socketio):
         """Join a chat room and initialize if needed"""
         try:
             chat_id = data.get('chat_id')
-            if not chat_id:
+            if not chat_id or not isinstance(chat_id, str):
                 socketio.emit('error', {'message': 'No chat ID provided'}, room=request.sid)
                 return
-            logger.info(f"Client {request.sid} joining chat: {chat_id}")
-            chat = db.get_chat(chat_id)
-            if not chat:
-                socketio.emit('error', {'message': 'Chat not found'}, room=request.sid)
+            session = session_store.get(request.sid)
+            if not session or not session.user_id:
+                socketio.emit('error', {'message': 'Unauthorized. Please login again', 'code': 'unauthorized'}, room=request.sid)
                 return
-            join_room(chat_id)
-            
+            if not session.allow('join_chat', SOCKET_JOIN_LIMIT):
+                socketio.emit('error', {'message': 'Too many requests, slow down', 'code': 'rate_limited'}, room=request.sid)
+                return
+            logger.info(f"Client {request.sid} joining chat: {chat_id}")
+
             stage = None
+            chat = None
             create_new_stage = False
+            rehydrated = False
             with active_stages_lock:
                 if chat_id in active_stages:
                     stage = active_stages[chat_id]
-                else:
-                    is_completed = chat.get('story_completed', False) or chat.get('completed', False)
-                    if is_completed:
-                        socketio.emit('objective_status', {
-                            'completed': True, 'story_completed': True,
-                            'index': chat.get('current_objective_index', 0),
-                            'total': len(chat.get('plot_objectives', [])),
-                            'message': 'Story is already complete.'
-                        }, room=request.sid)
-                        return
-                    create_new_stage = True
+                # only the owner's hibernated stage is restored; anyone else falls through to the check below
+                elif (stage := rehydrate_stage(chat_id, socketio, session.user_id)):
+                    rehydrated = True
+            if not stage:
+                # one query for the chat and everything a new stage needs; reused by Stage below
+                chat = db.get_stage_bootstrap(chat_id)
+                if not chat:
+                    socketio.emit('error', {'message': 'Chat not found'}, room=request.sid)
+                    return
+            # a live stage already knows its owner, so rejoining costs no database read
+            owner = stage.user_id if stage else chat.get('user_id')
+            if owner != session.user_id:
+                socketio.emit('error', {'message': 'Not authorized to access this chat', 'code': 'forbidden'}, room=request.sid)
+                return
+            session.chats.add(chat_id)
+            join_room(chat_id)
+
+            if not stage:
+                is_completed = chat.get('story_completed', False) or chat.get('completed', False)
+                if is_completed:
+                    socketio.emit('objective_status', {
+                        'completed': True, 'story_completed': True,
+                        'index': chat.get('current_objective_index', 0),
+                        'total': len(chat.get('plot_objectives', [])),
+                        'message': 'Story is already complete.'
+                    }, room=request.sid)
+                    return
+                create_new_stage = True
+
+            def run_stage():
+                try: stage.trigger_next_turn()
+                except Exception as e:
+                    logger.error(f"Stage error: {str(e)}", exc_info=True)
+                    socketio.emit('error', {'message': f'Error: {str(e)}', 'code': 'stage_error'}, room=chat_id)
+                    stage.is_processing = False
 
             if create_new_stage:
                 try:
                     logger.info(f"Creating new stage for chat_id: {chat_id}")
-                    stage = Stage(chat_id=chat_id, socketio=socketio)
+                    stage = Stage(chat_id=chat_id, socketio=socketio, chat_data=chat)
                     with active_stages_lock:
                         if chat_id not in active_stages:
                             active_stages[chat_id] = stage
@@ -123,19 +167,17 @@ def setup_socket_handlers(socketio):
                     
                     if stage == active_stages[chat_id]:
                         logger.info(f"Starting sequence for chat_id: {chat_id}")
-                        def run_stage():
-                            try: stage.trigger_next_turn()
-                            except Exception as e:
-                                logger.error(f"Stage error: {str(e)}", exc_info=True)
-                                socketio.emit('error', {'message': f'Error: {str(e)}', 'code': 'stage_error'}, room=chat_id)
-                                stage.is_processing = False
-                        threading.Thread(target=run_stage, daemon=True).start()
+                        stage_runtime.spawn(run_stage)
                 except Exception as e:
                     logger.error(f"Stage creation error: {str(e)}", exc_info=True)
                     socketio.emit('error', {'message': f'Error: {str(e)}', 'code': 'stage_error'}, room=request.sid)
                     return
-            
+            elif rehydrated:
+                logger.info(f"Resuming hibernated stage for chat_id: {chat_id}")
+                stage_runtime.spawn(run_stage)
+
             if stage:
+                stage.last_active_at = time.time()
                 try: current_obj = stage.plot_objectives[stage.current_objective_index]
                 except IndexError: current_obj = None
                 socketio.emit('objective_status', {
@@ -156,6 +198,14 @@ def setup_socket_handlers(socketio):
             if not chat_id or not player_input:
                 socketio.emit('error', {'message': 'Missing chat ID or input'}, room=request.sid)
                 return
+            # only chats this connection joined, with ownership checked at join time
+            session = session_store.get(request.sid)
+            if not session or chat_id not in session.chats:
+                socketio.emit('error', {'message': 'Join the chat before sending input', 'code': 'not_joined'}, room=request.sid)
+                return
+            if not session.allow('player_input', SOCKET_INPUT_LIMIT):
+                socketio.emit('error', {'message': 'Too many messages, slow down', 'code': 'rate_limited'}, room=request.sid)
+                return
             logger.info(f"Player input for chat {chat_id}: {player_input[:50]}...")
             
             # Get or create stage
@@ -163,7 +213,8 @@ def setup_socket_handlers(socketio):
             with active_stages_lock:
                 if chat_id in active_stages:
                     stage = active_stages[chat_id]
-                else:
+                elif not (stage := rehydrate_stage(chat_id, socketio, session.user_id)):
+                    # the joined chat's stage was evicted meanwhile
                     try:
                         stage = Stage(chat_id=chat_id, socketio=socketio)
                         active_stages[chat_id] = stage
@@ -184,7 +235,7 @@ def setup_socket_handlers(socketio):
                     socketio.emit('error', {'message': f'Error: {str(e)}', 'code': 'input_error'}, room=chat_id)
                 finally: stage.is_processing = False
             
-            threading.Thread(target=process_input, daemon=True).start()
+            stage_runtime.spawn(process_input)
             socketio.emit('status', {'message': 'Processing input...'}, room=chat_id)
         except Exception as e:
             logger.error(f"Input handler error: {str(e)}", exc_info=True)
@@ -210,3 +261,60 @@ def cleanup_inactive_stages():
             if active_stages[chat_id].story_completed:
                 logger.info(f"Removing completed stage for chat_id: {chat_id}")
                 del active_stages[chat_id]
+
+
+def stop_stage(chat_id):
+    """
+    Cancel a stage and drop it from active_stages once its buffered messages and state are
+    written (caller holds active_stages_lock), so a quick rejoin (a page reload) loads what
+    this stage produced instead of a stale chat and reused message sequences
+    """
+    stage = active_stages.pop(chat_id)
+    stage._cancel_all_operations()
+    stage.messages.close()
+    stage.messages.flush(force=True)
+    stage.state_writer.save(stage._state(), strong=True)
+
+
+def rehydrate_stage(chat_id, socketio, user_id=None):
+    """Restore a hibernated stage into active_stages (caller holds active_stages_lock);
+    with user_id, only a stage of that user's chat"""
+    snapshot = stage_hibernator.take(chat_id, user_id)
+    if not snapshot:
+        return None
+    try:
+        stage = Stage.from_snapshot(snapshot, socketio)
+    except Exception as e:
+        logger.error(f"Rehydrate error for chat_id {chat_id}: {str(e)}", exc_info=True)
+        return None
+    active_stages[chat_id] = stage
+    return stage
+
+
+def hibernate_idle_stages():
+    """Snapshot and evict stages idle for STAGE_IDLE_SECONDS, and the least recently active beyond STAGE_MAX_RESIDENT"""
+    now = time.time()
+    with active_stages_lock:
+        excess = len(active_stages) - STAGE_MAX_RESIDENT
+        for chat_id, stage in sorted(active_stages.items(), key=lambda item: item[1].last_active_at):
+            if excess <= 0 and now - stage.last_active_at < STAGE_IDLE_SECONDS:
+                break
+            # a connected player may be watching turns advance on their own without sending input
+            if session_store.watching(chat_id):
+                continue
+            try:
+                stage._cancel_all_operations()
+                # nothing a still-running turn adds may land after the snapshot is taken
+                stage.messages.close()
+                stage.messages.flush()
+                # every field that differs from what was last written, not just the ones already queued
+                stage.state_writer.save(stage._state(), strong=True)
+                if not stage.story_completed:
+                    size = stage_hibernator.save(chat_id, stage.snapshot())
+                    # any messages the flush could not write now travel with the snapshot
+                    stage.messages.discard()
+                    logger.info(f"Hibernated stage for chat_id: {chat_id} ({size} bytes)")
+            except Exception as e:
+                logger.error(f"Hibernate error for chat_id {chat_id}: {str(e)}", exc_info=True)
+            del active_stages[chat_id]
+            excess -= 1
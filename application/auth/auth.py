@@ -1,39 +1,183 @@
 from flask import Flask, request, jsonify
 from supabase import create_client
+from collections import OrderedDict
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
 import dotenv
 import os
 
+# Asymmetric (JWKS) verification needs PyJWT with cryptography; without it those tokens are checked remotely
+try:
+    import jwt
+except ImportError:
+    jwt = None
+
 dotenv.load_dotenv()
 
 app = Flask(__name__)
 
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_SECRET = os.getenv('SUPABASE_KEY')
+# Project JWT secret, for verifying HS256 access tokens locally
+SUPABASE_JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET')
+# Signing keys of projects using asymmetric JWTs
+SUPABASE_JWKS_URL = os.getenv('SUPABASE_JWKS_URL') or (f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"
+                                                       if SUPABASE_URL else None)
+SUPABASE_JWT_AUDIENCE = os.getenv('SUPABASE_JWT_AUDIENCE', 'authenticated')
+# Verified tokens kept until they expire, least recently used evicted first
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+# Lifetime of a cached remote verification when the token carries no readable expiry
+AUTH_CACHE_TTL = 300
+# Tolerated clock difference with the auth server, in seconds
+AUTH_CLOCK_SKEW = 30
 
 supabase = create_client(SUPABASE_URL, SUPABASE_SECRET)
 
-def get_current_user():
-    """Extract user ID from the authorization token"""
-    auth_header = request.headers.get("Authorization")
+
+class _Unverifiable(Exception):
+    """The token is well formed but cannot be checked locally"""
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def _user_from_claims(claims):
+    return {
+        'id': claims.get('sub'),
+        'email': claims.get('email'),
+        'phone': claims.get('phone'),
+        'role': claims.get('role'),
+        'aud': claims.get('aud'),
+        'app_metadata': claims.get('app_metadata') or {},
+        'user_metadata': claims.get('user_metadata') or {},
+    }
+
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens without a network round trip: HS256 tokens against the
+    project JWT secret, asymmetric ones against the project's JWKS (when PyJWT is installed).
+    Tokens that cannot be checked locally fall back to supabase.auth.get_user. Verified users
+    are cached in a bounded LRU until their token expires; rejected tokens are never cached.
+    """
+    def __init__(self, secret=SUPABASE_JWT_SECRET, jwks_url=SUPABASE_JWKS_URL, max_size=AUTH_CACHE_SIZE):
+        self.secret = secret.encode('utf-8') if secret else None
+        self.jwks = jwt.PyJWKClient(jwks_url, cache_keys=True) if jwt and jwks_url else None
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'local': 0, 'remote': 0, 'rejected': 0}
+
+    def verify(self, token):
+        """The user dict (id, email, metadata) for a valid token, or None"""
+        if not token:
+            return None
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[1] > now:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return cached[0]
+            if cached:
+                del self._cache[key]
+
+        try:
+            claims = self._verify_locally(token, now)
+            user = _user_from_claims(claims) if claims else None
+            expires_at = claims.get('exp') if claims else None
+            self.stats['local'] += 1
+        except _Unverifiable:
+            user, expires_at = self._verify_remotely(token)
+            self.stats['remote'] += 1
+            expires_at = expires_at or now + AUTH_CACHE_TTL
+
+        if not user or not user.get('id'):
+            self.stats['rejected'] += 1
+            return None
+        with self._lock:
+            self._cache[key] = (user, expires_at)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return user
+
+    def _verify_locally(self, token, now):
+        """Claims of a valid token, None for an invalid one; raises _Unverifiable when no key is available"""
+        try:
+            header_segment, payload_segment, signature_segment = token.split('.')
+            header = json.loads(_b64decode(header_segment))
+            claims = json.loads(_b64decode(payload_segment))
+            signature = _b64decode(signature_segment)
+        except (ValueError, TypeError):
+            return None
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            return None
+
+        alg = header.get('alg')
+        if alg == 'HS256' and self.secret:
+            expected = hmac.new(self.secret, f"{header_segment}.{payload_segment}".encode('ascii'), hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, signature):
+                return None
+        elif alg in ('RS256', 'ES256') and self.jwks:
+            try:
+                signing_key = self.jwks.get_signing_key_from_jwt(token)
+                claims = jwt.decode(token, signing_key.key, algorithms=[alg], options={'verify_aud': False, 'verify_exp': False})
+            except jwt.PyJWKClientError as e:
+                print(f"Error fetching JWKS: {str(e)}")
+                raise _Unverifiable()
+            except jwt.InvalidTokenError:
+                return None
+        else:
+            raise _Unverifiable()
+
+        expires_at = claims.get('exp')
+        if not isinstance(expires_at, (int, float)) or expires_at + AUTH_CLOCK_SKEW < now:
+            return None
+        audience = claims.get('aud')
+        audiences = audience if isinstance(audience, list) else [audience]
+        if SUPABASE_JWT_AUDIENCE and SUPABASE_JWT_AUDIENCE not in audiences:
+            return None
+        return claims
+
+    def _verify_remotely(self, token):
+        try:
+            response = supabase.auth.get_user(token)
+            user = response.user if hasattr(response, 'user') else None
+        except Exception as e:
+            print(f"Error authenticating user: {str(e)}")
+            return None, None
+        if not user:
+            return None, None
+        user_data = user.model_dump() if hasattr(user, 'model_dump') else user.dict()
+        # the expiry is read from the token, which the auth server has just accepted
+        try:
+            expires_at = json.loads(_b64decode(token.split('.')[1])).get('exp')
+        except (ValueError, IndexError, AttributeError):
+            expires_at = None
+        if not isinstance(expires_at, (int, float)):
+            expires_at = None
+        return user_data, expires_at
+
+
+token_verifier = TokenVerifier()
+
+
+def token_from_header(auth_header):
+    """Extract the token from an Authorization header (handle both "Bearer token" and just "token" formats)"""
     if not auth_header:
         return None
-        
-    # Extract token (handle both "Bearer token" and just "token" formats)
     if auth_header.startswith("Bearer "):
-        token = auth_header.split("Bearer ")[1]
-    else:
-        token = auth_header
-        
-    try:
-        # Get user from Supabase with the token
-        response = supabase.auth.get_user(token)
-        user = response.user if hasattr(response, 'user') else None
-        
-        if user:
-            # With the updated Supabase SDK, explicit authentication happens when we call get_user()
-            # We don't need to set anything else for authentication to work
-            return user.id
-        return None
-    except Exception as e:
-        print(f"Error authenticating user: {str(e)}")
-        return None
\ No newline at end of file
+        return auth_header.split("Bearer ")[1]
+    return auth_header
+
+
+def get_current_user():
+    """Extract user ID from the authorization token"""
+    user = token_verifier.verify(token_from_header(request.headers.get("Authorization")))
+    return user['id'] if user else None
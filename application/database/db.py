@@ -1,5 +1,5 @@
 import os
-import json
+from application.utils.serialization import dumps
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from typing import Dict, List, Optional, Any, Union
@@ -113,7 +113,7 @@ class SupabaseDB:
             'creator_id': creator_id,
             'name': name,
             'description': description,
-            'characters': json.dumps(characters),
+            'characters': dumps(characters),
             'relations': relations,
             'image_url': image_url
         }
@@ -125,7 +125,7 @@ class SupabaseDB:
         """Update a show's data"""
         # Convert characters to JSON string if provided
         if 'characters' in data and isinstance(data['characters'], dict):
-            data['characters'] = json.dumps(data['characters'])
+            data['characters'] = dumps(data['characters'])
             
         response = self.supabase.table('shows').update(data).eq('id', show_id).execute()
         return response.data[0] if response.data else None
@@ -183,7 +183,7 @@ class SupabaseDB:
             'description': description,
             'player_role': player_role,
             'background': background,
-            'plot_objectives': json.dumps(plot_objectives)
+            'plot_objectives': dumps(plot_objectives)
         }
         
         response = self.supabase.table('episodes').insert(episode_data).execute()
@@ -193,7 +193,7 @@ class SupabaseDB:
         """Update an episode's data"""
         # Convert plot_objectives to JSON string if provided
         if 'plot_objectives' in data and isinstance(data['plot_objectives'], list):
-            data['plot_objectives'] = json.dumps(data['plot_objectives'])
+            data['plot_objectives'] = dumps(data['plot_objectives'])
             
         response = self.supabase.table('episodes').update(data).eq('id', episode_id).execute()
         return response.data[0] if response.data else None
@@ -234,7 +234,21 @@ class SupabaseDB:
         
         return response.data[0]
     
-    def create_chat(self, episode_id: str,show_id: str, user_id: str, player_name: str,chat_speed: float, player_description: str) -> dict:
+    def get_stage_bootstrap(self, chat_id: str) -> dict:
+        """Get a chat with its episode, show, messages and achievements in a single query"""
+        response = self.supabase.table('chats') \
+            .select('*, episodes(*, shows(*)), messages(*), achievements(*)') \
+            .eq('id', chat_id) \
+            .execute()
+        
+        if not response.data:
+            return None
+        
+        chat = response.data[0]
+        chat['messages'] = sorted(chat.get('messages') or [], key=lambda m: m.get('sequence') or 0)
+        return chat
+    
+    def create_chat(self, episode_id: str,show_id: str, user_id: str, player_name: str,chat_speed: float, player_description: str, stage_mode: Optional[str] = None) -> dict:
         """Create a new chat session"""
         chat_data = {
             'episode_id': episode_id,
@@ -246,6 +260,9 @@ class SupabaseDB:
             'chat_speed': chat_speed,
             'current_objective_index': 0
         }
+        # Only sent when chosen so the episode's default (or 'standard') applies otherwise
+        if stage_mode:
+            chat_data['stage_mode'] = stage_mode
         
         response = self.supabase.table('chats').insert(chat_data).execute()
         return response.data[0] if response.data else None
@@ -0,0 +1,186 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from application.utils.serialization import dumps, loads
+
+# Local SQLite file holding the queue, so queued work survives a crash or restart; its
+# directory is created on first use
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join('instance', 'jobs.sqlite3'))
+# Background workers per process
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+# Attempts per job before it is marked failed, with exponential backoff between them
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BASE_DELAY = float(os.getenv('JOB_RETRY_BASE_DELAY', '5'))
+# Finished jobs are kept this long (seconds) so their dedup keys keep rejecting duplicates
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', str(24 * 3600)))
+# Longest a worker sleeps before looking for delayed jobs that became due
+JOB_POLL_INTERVAL = 5.0
+
+logger = logging.getLogger("JobQueue")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedup_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_at);
+"""
+
+
+class JobQueue:
+    """
+    Durable background job queue for post-turn work (achievement detection, archival, media
+    post-processing). Jobs are rows in a local SQLite file and are run by a bounded pool of
+    workers through handlers registered per kind. A job with a dedup key is enqueued at most
+    once; failed jobs are retried with backoff, and jobs left running by a crash are requeued
+    on start.
+    """
+    def __init__(self, path=JOB_DB_PATH, workers=JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.handlers = {}
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wake = threading.Condition()
+        self._started = False
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and self.path != ':memory:':
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def handler(self, kind):
+        """Decorator registering fn(payload) as the handler for a job kind"""
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def start(self):
+        """Requeue jobs interrupted by a crash and start the worker pool (idempotent)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self.conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+                              (time.time(),))
+        for index in range(self.workers):
+            threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True).start()
+
+    def enqueue(self, kind, payload, dedup_key=None, delay=0, max_attempts=JOB_MAX_ATTEMPTS):
+        """Add a job; returns False if a job with the same dedup key already exists"""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO jobs (kind, payload, dedup_key, max_attempts, run_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, dumps(payload), dedup_key, max_attempts, now + delay, now, now))
+        if not cursor.rowcount:
+            return False
+        self.start()
+        with self._wake:
+            self._wake.notify()
+        return True
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND run_at <= ? ORDER BY run_at LIMIT 1",
+                    (now,)).fetchone()
+                if row:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (now, row['id']))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return row
+
+    def _finish(self, job, error=None):
+        now = time.time()
+        attempts = job['attempts'] + 1
+        with self._lock:
+            if error is None:
+                self.conn.execute("UPDATE jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+                                  (now, job['id']))
+            elif attempts < job['max_attempts']:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'queued', run_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                    (now + JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), error, now, job['id']))
+            else:
+                self.conn.execute("UPDATE jobs SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                                  (error, now, job['id']))
+            self.conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                              (now - JOB_RETENTION,))
+
+    def _idle_wait(self):
+        """Seconds until the next delayed job is due, capped at the poll interval"""
+        with self._lock:
+            row = self.conn.execute("SELECT MIN(run_at) AS due FROM jobs WHERE status = 'queued'").fetchone()
+        if row['due'] is None:
+            return JOB_POLL_INTERVAL
+        return min(JOB_POLL_INTERVAL, max(0.01, row['due'] - time.time()))
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                logger.error(f"Error claiming job: {str(e)}", exc_info=True)
+                job = None
+            if job is None:
+                with self._wake:
+                    self._wake.wait(self._idle_wait())
+                continue
+
+            handler = self.handlers.get(job['kind'])
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler for job kind {job['kind']}")
+                handler(loads(job['payload']))
+            except Exception as e:
+                logger.error(f"Error running job {job['kind']} #{job['id']}: {str(e)}", exc_info=True)
+                self._finish(job, str(e))
+            else:
+                self._finish(job)
+
+    def stats(self):
+        """Job counts per kind and status, with the oldest queued job's age"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT kind, status, COUNT(*) AS count, MIN(created_at) AS oldest FROM jobs GROUP BY kind, status"
+            ).fetchall()
+        now = time.time()
+        stats = {}
+        for row in rows:
+            kind = stats.setdefault(row['kind'], {})
+            kind[row['status']] = row['count']
+            if row['status'] == 'queued':
+                kind['oldest_queued_age'] = now - row['oldest']
+        return {'workers': self.workers, 'kinds': stats}
+
+
+# Process-wide queue; handlers are registered by the modules that own the work
+job_queue = JobQueue()
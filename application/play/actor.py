@@ -1,16 +1,15 @@
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.prompts import ChatPromptTemplate
 from application.ai.llm import actor_llm
+from application.ai.telemetry import call_config
+from application.ai.runtime import llm_runtime
+from application.ai.scheduler import PRIORITY_TURN
+from application.play.context import estimate_tokens
 
-class Actor:
-    def __init__(self, name, description, relations, background, llm):
-        self.name = name
-        self.description = description
-        self.relations = relations
-        self.background = background
-        self.llm = llm
 
-        self.system_prompt = f"""
+def render_actor_prompt(name, description, relations, background):
+    """System prompt for an actor; stages of the same episode share it through the cast cache"""
+    return f"""
             # Character Role:
             You are an actor in a drama, portraying the role of {name}.
 
@@ -30,8 +29,20 @@ class Actor:
             - Provide only one line of dialogue that reflects your unique voice and the guidance given by the director.
             """
 
-    def reply(self,chat_history, instructions):
 
+class Actor:
+    def __init__(self, name, description, relations, background, llm, chat_id=None, user_id=None, system_prompt=None):
+        self.name = name
+        self.description = description
+        self.relations = relations
+        self.background = background
+        self.llm = llm
+        self.chat_id = chat_id
+        self.user_id = user_id
+
+        self.system_prompt = system_prompt or render_actor_prompt(name, description, relations, background)
+
+    def _build_chain(self, chat_history, instructions):
         actor_prompt = f"""# Current chat history:
             {chat_history}
 
@@ -50,6 +61,19 @@ class Actor:
             HumanMessage(content=actor_prompt)
         ]
         chat_prompt = ChatPromptTemplate.from_messages(messages)
-        chain = chat_prompt | self.llm 
-        dialogue = chain.invoke({})
+        return chat_prompt | self.llm, estimate_tokens(self.system_prompt) + estimate_tokens(actor_prompt)
+
+    def _config(self, priority, **metadata):
+        return call_config('actor.reply', self.chat_id, user_id=self.user_id, priority=priority, role=self.name, **metadata)
+
+    def reply(self, chat_history, instructions, priority=PRIORITY_TURN):
+        chain, prompt_tokens = self._build_chain(chat_history, instructions)
+        dialogue = llm_runtime.invoke(chain, self._config(priority), prompt_tokens)
         return dialogue.content
+
+    def stream_reply(self, chat_history, instructions, priority=PRIORITY_TURN):
+        """Yield the line in chunks as the model produces them"""
+        chain, prompt_tokens = self._build_chain(chat_history, instructions)
+        for chunk in llm_runtime.stream(chain, self._config(priority, streamed=True), prompt_tokens):
+            if chunk.content:
+                yield chunk.content
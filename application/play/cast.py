@@ -0,0 +1,95 @@
+import hashlib
+import json
+import threading
+import weakref
+from application.play.actor import render_actor_prompt
+from application.play.director import render_director_prompt
+from application.utils.serialization import dumps_bytes, loads
+
+
+class CastBundle:
+    """
+    Immutable show/episode data shared by every stage of the same episode: parsed characters,
+    relations, plot objectives, and the actors' system prompts and the show part of the director's
+    system prompt rendered for the episode background.
+    """
+    def __init__(self, show_id, episode_id, version, show, description, characters, relations,
+                 plot_objectives, background):
+        self.show_id = show_id
+        self.episode_id = episode_id
+        self.version = version
+        self.show = show
+        self.description = description
+        self.characters = tuple((name, desc) for name, desc in characters)
+        self.relations = relations
+        self.plot_objectives = tuple(plot_objectives)
+        self.background = background
+        self.actor_prompts = {name: render_actor_prompt(name, desc, relations, background)
+                              for name, desc in self.characters}
+        self.show_prompt = render_director_prompt(show, description, background, dict(self.characters), relations)
+
+    def actor_prompt(self, name, background):
+        """The shared system prompt for an actor, if the stage is still on the episode background"""
+        return self.actor_prompts.get(name) if background == self.background else None
+
+    def director_prompt(self, background):
+        """The shared show part of the director's system prompt, if the stage is still on the episode background"""
+        return self.show_prompt if background == self.background else None
+
+
+def _parse_json_field(field):
+    try:
+        if isinstance(field, str):
+            return loads(field)
+        return field or []
+    except json.JSONDecodeError:
+        return []
+
+
+def _parse_characters(field):
+    characters = []
+    for character in _parse_json_field(field):
+        char_name = character.get('name') if isinstance(character, dict) else character.name
+        char_desc = character.get('description') if isinstance(character, dict) else character.description
+        characters.append((char_name.strip().lower(), char_desc))
+    return characters
+
+
+class CastCache:
+    """
+    Cast bundles keyed by (show_id, episode_id, version), where the version is a digest of the
+    raw show and episode fields, so an edited show gets a fresh bundle. Entries are weak
+    references: a bundle lives exactly as long as some stage holds it.
+    """
+    def __init__(self):
+        self._bundles = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._bundles)
+
+    def _get(self, key, build):
+        with self._lock:
+            bundle = self._bundles.get(key)
+            if bundle is None:
+                bundle = build()
+                self._bundles[key] = bundle
+            return bundle
+
+    def for_episode(self, show_id, episode_id, show_data, episode_data):
+        """Bundle for a show and episode row; characters and objectives are only parsed on a miss"""
+        raw = [show_data.get(field) for field in ('name', 'description', 'characters', 'relations')]
+        raw += [episode_data.get(field) for field in ('plot_objectives', 'background')]
+        version = hashlib.sha1(dumps_bytes(raw)).hexdigest()[:16]
+        return self._get((show_id, episode_id, version), lambda: CastBundle(
+            show_id, episode_id, version, show_data.get('name', ''), show_data.get('description', ''),
+            _parse_characters(show_data.get('characters', '[]')), show_data.get('relations', ''),
+            _parse_json_field(episode_data.get('plot_objectives', '[]')), episode_data.get('background', '')))
+
+    def restore(self, show_id, episode_id, version, show, description, characters, relations, plot_objectives, background):
+        """Bundle for already parsed data, e.g. from a stage snapshot"""
+        return self._get((show_id, episode_id, version), lambda: CastBundle(
+            show_id, episode_id, version, show, description, characters, relations, plot_objectives, background))
+
+
+cast_cache = CastCache()
@@ -0,0 +1,143 @@
+import os
+import threading
+from application.play.runtime import stage_runtime
+
+# Token budget for the live transcript sent with every actor and director prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '6000'))
+
+SUMMARY_PREFIX = "Earlier in this scene:"
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (roughly four characters per token for English prose)"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+class ContextWindow:
+    """
+    Rolling transcript of the current scene.
+    Lines are kept as rendered "role: content" strings with their token estimates.
+    Once the lines exceed the token budget, the oldest half is folded into a running
+    summary through `summarizer(summary, lines) -> str`, so prompts stay bounded.
+    The summary is written on the stage runtime: the lines stay in the window until it is
+    ready, so appending never waits on a model call. The rendered text is cached until the
+    next change.
+    """
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, summarizer=None):
+        self.budget = budget
+        self.summarizer = summarizer
+        self.summary = ''
+        self._lines = []
+        self._tokens = []
+        self._total = 0
+        self._rendered = ''
+        self._folding = False       # a summary is being written in the background
+        self._epoch = 0             # bumped by clear/load, so a stale summary is dropped
+        self._lock = threading.RLock()
+
+    def __str__(self):
+        return self.render()
+
+    def __bool__(self):
+        return bool(self.summary or self._lines)
+
+    @property
+    def tokens(self):
+        return self._total + estimate_tokens(self.summary)
+
+    def render(self):
+        with self._lock:
+            if self._rendered is None:
+                parts = [f"{SUMMARY_PREFIX} {self.summary}"] if self.summary else []
+                self._rendered = "\n".join(parts + self._lines)
+            return self._rendered
+
+    def render_with(self, role, content):
+        """Text as it would read once `role: content` is appended, without changing the window"""
+        current = self.render()
+        line = f"{role}: {content}"
+        return f"{current}\n{line}" if current else line
+
+    def append(self, role, content):
+        self._add_line(f"{role}: {content}")
+
+    def _add_line(self, line, fold=True):
+        with self._lock:
+            tokens = estimate_tokens(line)
+            self._lines.append(line)
+            self._tokens.append(tokens)
+            self._total += tokens
+            self._rendered = None
+            if fold and self._total > self.budget:
+                self._fold()
+
+    def _fold(self):
+        """Start folding the oldest lines into the summary until the lines would use half the budget"""
+        if self._folding:
+            return
+        count, remaining = 0, self._total
+        while len(self._lines) - count > 1 and remaining > self.budget // 2:
+            remaining -= self._tokens[count]
+            count += 1
+        if not count:
+            return
+        self._folding = True
+        stage_runtime.spawn(self._summarize, self._epoch, self.summary, self._lines[:count])
+
+    def _summarize(self, epoch, summary, folded):
+        try:
+            if not self.summarizer:
+                raise ValueError("No summarizer configured")
+            # the summary is stored as a single line so it survives a save/load round trip
+            summary = " ".join(self.summarizer(summary, "\n".join(folded)).split())
+        except Exception as e:
+            print(f"Error summarizing context: {str(e)}")
+            # keep the most recent part of the folded text rather than losing it
+            text = " ".join(filter(None, [summary] + folded))
+            summary = text[-(self.budget // 4) * 4:]
+        with self._lock:
+            # the window was cleared or reloaded meanwhile
+            if epoch != self._epoch:
+                return
+            self._folding = False
+            # lines were retracted back into the folded part
+            if self._lines[:len(folded)] != folded:
+                return
+            del self._lines[:len(folded)]
+            self._total -= sum(self._tokens[:len(folded)])
+            del self._tokens[:len(folded)]
+            self.summary = summary
+            self._rendered = None
+            if self._total > self.budget:
+                self._fold()
+
+    def retract(self, lines):
+        """Remove `lines` ("role: content") from the end of the window, newest last, as far as they
+        are still there; lines already folded into the summary stay in it"""
+        with self._lock:
+            for line in reversed(lines):
+                if not self._lines or self._lines[-1] != line:
+                    break
+                self._lines.pop()
+                self._total -= self._tokens.pop()
+                self._rendered = None
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._folding = False
+            self.summary = ''
+            self._lines, self._tokens, self._total = [], [], 0
+            self._rendered = ''
+
+    def load(self, text):
+        """Restore a window from its rendered text, as stored in the chats table.
+        Folding is left to the next append so loading never calls the summarizer."""
+        with self._lock:
+            self.clear()
+            for line in (text or '').split("\n"):
+                if line.startswith(SUMMARY_PREFIX) and not self._lines and not self.summary:
+                    self.summary = line[len(SUMMARY_PREFIX):].strip()
+                    self._rendered = None
+                elif line:
+                    self._add_line(line, fold=False)
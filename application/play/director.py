@@ -3,8 +3,71 @@ from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from application.ai.llm import director_llm
+from application.ai.llm import director_llm, fallback_for, model_router
+from application.ai.telemetry import call_config
+from application.ai.runtime import llm_runtime
+from application.ai.scheduler import PRIORITY_TURN, PRIORITY_OBJECTIVE, PRIORITY_BACKGROUND
+from application.play.context import estimate_tokens
 import json
+import re
+
+
+def render_director_prompt(show, description, background, characters, relations):
+    """Show part of the director's system prompt; stages of the same episode share it through the cast cache"""
+    return f"""
+            # role
+            You are the Creative Director of the TV show titled "{show}" on an interactive storytelling platform. The show unfolds as a group chat in which you guide AI-controlled characters. Your primary responsibility is to craft an engaging narrative for the player while maintaining coherent character development, authentic relationships, and compelling plot progression.
+            # Show Details
+            - Name: {show}
+            - Description: {description}
+            - Current Scenario: {background}
+            - Characters: {characters}
+            - Character Relationships: {relations}
+"""
+
+
+def iter_script_steps(chunks):
+    """
+    Incrementally parse streamed JSON text and yield each object of its "scripts" array
+    as soon as the object is complete, without waiting for the rest of the document.
+    """
+    buffer = ''
+    pos = start = None
+    depth = 0
+    in_string = escaped = False
+    for chunk in chunks:
+        buffer += chunk
+        if pos is None:
+            match = re.search(r'"scripts"\s*:\s*\[', buffer)
+            if not match:
+                continue
+            pos = match.end()
+        while pos < len(buffer):
+            ch = buffer[pos]
+            pos += 1
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == '{':
+                if depth == 0:
+                    start = pos - 1
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+                if depth == 0:
+                    try:
+                        yield json.loads(buffer[start:pos])
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed script step: {str(e)}")
+            elif ch == ']' and depth == 0:
+                return
+
 class ScriptStep(BaseModel):
     role: str = Field(..., description="Character name or 'Narration' (should not be the player)")
     instruction: Optional[str] = Field(None, description="Instruction guidance for characters")
@@ -14,6 +77,14 @@ class TurnOutput(BaseModel):
     planning: str = Field(..., description="Planning for the next turn.")
     scripts: List[ScriptStep] = Field(..., description="List of script elements with role and instruction or content")
 
+class EnsembleStep(BaseModel):
+    role: str = Field(..., description="Character name or 'Narration' (should not be the player)")
+    line: str = Field(..., description="The exact line the character says, or the narration text")
+
+class EnsembleOutput(BaseModel):
+    planning: str = Field(..., description="Planning for the next turn.")
+    scripts: List[EnsembleStep] = Field(..., description="List of finished lines with role and line")
+
 class Achievement(BaseModel):
     title: str = Field(..., description="Achievement title.")
     reason: str = Field(..., description="Justification for the achievement and score.")
@@ -21,10 +92,12 @@ class Achievement(BaseModel):
 
 class AchievementsOutput(BaseModel):
     achievements: List[Achievement] = Field(..., description="List of detected achievements.")
+    confidence: float = Field(..., description="How confident you are in this assessment, from 0 to 1.")
 
 class ObjectiveCheckOutput(BaseModel):
     completed: bool = Field(..., description="Boolean indicating if objective achieved.")
     reason: str = Field(..., description="Explanation of why or why not.")
+    confidence: float = Field(..., description="How confident you are in this assessment, from 0 to 1.")
 
 class OutlineOutput(BaseModel):
     previous_outline: str = Field(..., description="A comprehensive analysis of the narrative so far, including key events, character development, player choices, and their consequences.")
@@ -32,7 +105,7 @@ class OutlineOutput(BaseModel):
 
 class Director:
 
-    def __init__(self,llm,show,description,background,actors,player,relations):
+    def __init__(self,llm,show,description,background,actors,player,relations,chat_id=None,user_id=None,show_prompt=None):
 
         self.show = show
         self.description = description
@@ -41,23 +114,21 @@ class Director:
         self.player = player
         self.relations = relations
         self.llm = llm
+        self.chat_id = chat_id
+        self.user_id = user_id
 
          # Parsers using PydanticOutputParser
         self.outline_parser = JsonOutputParser(pydantic_object=OutlineOutput)
         self.turn_parser = JsonOutputParser(pydantic_object=TurnOutput)
+        self.ensemble_parser = JsonOutputParser(pydantic_object=EnsembleOutput)
         self.check_parser = JsonOutputParser(pydantic_object=ObjectiveCheckOutput)
         self.achievement_parser =JsonOutputParser(pydantic_object=AchievementsOutput)
 
-        self.system_prompt = f"""
-            # role
-            You are the Creative Director of the TV show titled "{show}" on an interactive storytelling platform. The show unfolds as a group chat in which you guide AI-controlled characters. Your primary responsibility is to craft an engaging narrative for the player while maintaining coherent character development, authentic relationships, and compelling plot progression.
-            # Show Details
-            - Name: {show}
-            - Description: {description}
-            - Current Scenario: {background}
-            - Characters: {actors}
-            - Character Relationships: {relations}
-            # PLAYER INTEGRATION
+        if show_prompt is None:
+            characters = {name: getattr(actor, 'description', actor) for name, actor in actors.items()}
+            show_prompt = render_director_prompt(show, description, background, characters, relations)
+        # only the player section is specific to this chat
+        self.system_prompt = show_prompt + f"""            # PLAYER INTEGRATION
             A human player participates as a character in this experience. Unlike the AI-controlled characters you direct, the player has full agency and makes their own choices. Your role is to create meaningful interactions between the AI characters and the player.
 
             Player Name: {player.name}
@@ -71,7 +142,42 @@ class Director:
             - Preserve the established tone and rules of the world
                         """
         
-    def generate_outline(self,chat_history,plot_objective):
+    def _chat_prompt(self, prompt):
+        messages = [
+            SystemMessage(content=self.system_prompt),
+            HumanMessage(content=prompt)
+        ]
+        return ChatPromptTemplate.from_messages(messages)
+
+    def _run(self, prompt, parser, call_site, priority=PRIORITY_TURN, schema=None):
+        """Run a director prompt through the shared LLM runtime on the model tier routed for its task"""
+        chat_prompt = self._chat_prompt(prompt)
+        config = call_config(call_site, self.chat_id, user_id=self.user_id, priority=priority)
+        prompt_tokens = estimate_tokens(self.system_prompt) + estimate_tokens(prompt)
+
+        def build(llm):
+            chain = chat_prompt | llm
+            return chain | parser if parser else chain
+
+        def run(llm):
+            fallback_llm = fallback_for(llm)
+            return llm_runtime.invoke(build(llm), config, prompt_tokens,
+                                      fallback=build(fallback_llm) if fallback_llm else None)
+
+        return model_router.route(call_site.split('.')[-1], run, self.llm, schema)
+
+    def _stream_steps(self, prompt, call_site, priority=PRIORITY_TURN):
+        """Stream a script prompt on the director model and yield its steps as they complete"""
+        chat_prompt = self._chat_prompt(prompt)
+        fallback_llm = fallback_for(self.llm)
+        config = call_config(call_site, self.chat_id, user_id=self.user_id, priority=priority, streamed=True)
+        chunks = llm_runtime.stream(chat_prompt | self.llm, config,
+                                    estimate_tokens(self.system_prompt) + estimate_tokens(prompt),
+                                    fallback=chat_prompt | fallback_llm if fallback_llm else None)
+        for step in iter_script_steps(chunk.content for chunk in chunks):
+            yield step
+
+    def generate_outline(self,chat_history,plot_objective,priority=PRIORITY_TURN):
         fmt = self.outline_parser.get_format_instructions()
         outline_prompt = f"""
             # Instructions
@@ -110,17 +216,11 @@ class Director:
             Please output ONLY valid JSON that conforms to the format instructions below:
             {fmt}
                 """
-        messages = [
-            SystemMessage(content=self.system_prompt),
-            HumanMessage(content=outline_prompt)
-        ]
-        chat_prompt = ChatPromptTemplate.from_messages(messages)
-        chain = chat_prompt | self.llm | self.outline_parser
-        outline = chain.invoke({})
+        outline = self._run(outline_prompt, self.outline_parser, 'director.generate_outline', priority)
         print(json.dumps(outline, indent=4))
         return outline
     
-    def generate_turn_instructions(self,chat_history,outline,plot_failure_reason='None',plot_objective='',num_lines=5):
+    def _turn_prompt(self,chat_history,outline,plot_failure_reason='None',plot_objective='',num_lines=5):
         fmt = self.turn_parser.get_format_instructions()
         dialogue_turn_prompt = f"""
                     # Planning Step
@@ -196,17 +296,84 @@ class Director:
                     Please output ONLY valid JSON that conforms to the format instructions below:
                     {fmt}
                     """
+        return dialogue_turn_prompt
 
-        messages = [
-            SystemMessage(content=self.system_prompt),
-            HumanMessage(content=dialogue_turn_prompt)
-        ]
-        chat_prompt = ChatPromptTemplate.from_messages(messages)
-        chain = chat_prompt | self.llm | self.turn_parser
-        script = chain.invoke({})
+    def generate_turn_instructions(self,chat_history,outline,plot_failure_reason='None',plot_objective='',num_lines=5,priority=PRIORITY_TURN):
+        prompt = self._turn_prompt(chat_history, outline, plot_failure_reason, plot_objective, num_lines)
+        script = self._run(prompt, self.turn_parser, 'director.generate_turn_instructions', priority)
         print(json.dumps(script, indent=4))
         return script
+
+    def stream_turn_instructions(self,chat_history,outline,plot_failure_reason='None',plot_objective='',num_lines=5,priority=PRIORITY_TURN):
+        """Yield each ScriptStep of the turn as soon as the director has finished writing it"""
+        prompt = self._turn_prompt(chat_history, outline, plot_failure_reason, plot_objective, num_lines)
+        return self._stream_steps(prompt, 'director.generate_turn_instructions', priority)
     
+    def _ensemble_prompt(self,chat_history,outline,plot_failure_reason='None',plot_objective='',num_lines=5):
+        fmt = self.ensemble_parser.get_format_instructions()
+        cast = "\n".join(f"- {actor.name}: {actor.description}" for actor in self.actors.values())
+        ensemble_prompt = f"""
+                    # Planning Step
+                    ## Before writing any lines, evaluate:
+                    # 1. Is the plot objective already satisfied in chat_history? If yes, return [] immediately.
+                    # 2. Does chat_history contain an unresolved player message? If yes, mark it as "unattended".
+                    ## Once planning is complete, proceed only if objective not met.
+
+                    # Instruction for Scene Writing
+                    ## Core Task
+                    You are writing the finished scene yourself: turn the provided outline into the actual lines the characters say, in their own voices, so they can be delivered to the group chat as-is.
+
+                    ## Scene Parameters
+                    - Write exactly {num_lines} lines (or fewer if the outline completes naturally)
+                    - Each line must be either:
+                        - A single line of in-character dialogue for one character
+                        - Brief narration (scene-setting or transition), with role "Narration"
+
+                    ## Writing Guidelines
+                    - Every character line must sound like that character: personality, relationships and speech patterns from the cast below
+                    - One line per element: no multi-turn responses, stage directions or the speaker's name inside the line
+                    - Keep narration brief and visual, and use it sparingly
+
+                    ## Player Engagement (CRITICAL)
+                    - NEVER write lines for the player or narrate the player's actions or internal states.
+                    -(**MOST IMPORTANT**) If there is any player message in chat_history that has not been answered by any character then the FIRST line must be a character answering the player's message.(**MOST IMPORTANT**)
+                    - Present clear choices at decision points instead of relying on the player to supply key plot details.
+
+                    ## Content Constraints
+                    - NEVER repeat scenes or dialogue from chat_history.
+                    - Follow logical progression from chat_history and outline, skipping outline elements already covered.
+                    - Address subtle reasons for past plot failures through character behavior.
+
+                    # Context Resources
+
+                        ## Cast:
+                            {cast}
+                        ## Outline: 
+                            {outline}
+                        ## Chat History: 
+                            {chat_history}
+                        ## Plot Objective:
+                            {plot_objective}
+                        ## Plot Failure Reason: 
+                            {plot_failure_reason}
+
+                    # Output Format
+                    Please output ONLY valid JSON that conforms to the format instructions below:
+                    {fmt}
+                    """
+        return ensemble_prompt
+
+    def generate_ensemble_scene(self,chat_history,outline,plot_failure_reason='None',plot_objective='',num_lines=5,priority=PRIORITY_TURN):
+        prompt = self._ensemble_prompt(chat_history, outline, plot_failure_reason, plot_objective, num_lines)
+        script = self._run(prompt, self.ensemble_parser, 'director.generate_ensemble_scene', priority)
+        print(json.dumps(script, indent=4))
+        return script
+
+    def stream_ensemble_scene(self,chat_history,outline,plot_failure_reason='None',plot_objective='',num_lines=5,priority=PRIORITY_TURN):
+        """Yield each EnsembleStep of the scene as soon as the director has finished writing it"""
+        prompt = self._ensemble_prompt(chat_history, outline, plot_failure_reason, plot_objective, num_lines)
+        return self._stream_steps(prompt, 'director.generate_ensemble_scene', priority)
+
     def check_objective(self,chat_history,plot_objective):
         fmt = self.check_parser.get_format_instructions()
         check_objective_prompt = f"""
@@ -219,7 +386,7 @@ class Director:
                 Provide your answer as valid JSON in the following format:
 
                 ```
-                {{"completed": true or false, "reason": "Your reason"}}
+                {{"completed": true or false, "reason": "Your reason", "confidence": 0.0 to 1.0}}
                 ```
 
                 Return only a valid JSON string without any additional formatting or commentary.
@@ -234,22 +401,36 @@ class Director:
 
                 Example:
                 ```
-                {{"completed": false, "reason": "The chat history does not clearly show the protagonist confronting their fears."}}
-                {{"completed": true, "reason": "The chat history clearly shows the protagonist confronting their fears, which matches the plot objective."}}
+                {{"completed": false, "reason": "The chat history does not clearly show the protagonist confronting their fears.", "confidence": 0.9}}
+                {{"completed": true, "reason": "The chat history clearly shows the protagonist confronting their fears, which matches the plot objective.", "confidence": 0.8}}
                 ```
                 # Output Format
                 Please output ONLY valid JSON that conforms to the format instructions below:
                 {fmt}
                 """
-        messages = [
-            SystemMessage(content=self.system_prompt),
-            HumanMessage(content=check_objective_prompt)
-        ]
-        chat_prompt = ChatPromptTemplate.from_messages(messages)
-        chain = chat_prompt | self.llm | self.check_parser
-        objective_status = chain.invoke({})
+        objective_status = self._run(check_objective_prompt, self.check_parser, 'director.check_objective', PRIORITY_OBJECTIVE,
+                                     schema=ObjectiveCheckOutput)
         return objective_status
 
+    def summarize_context(self, summary, lines):
+        summary_prompt = f"""
+            # Instruction
+            The chat history of the current scene has grown too long and its oldest lines are being folded into a running summary.
+            Update the summary below with the new lines so that it:
+            - keeps every plot-relevant event, decision and revelation in chronological order
+            - keeps everything the player said or did and how the characters reacted
+            - stays under 200 words
+
+            Return only the updated summary as plain text, without any headings or commentary.
+
+            # Context
+            ## Current Summary:
+            {summary or 'None'}
+            ## Lines to fold in:
+            {lines}
+            """
+        return self._run(summary_prompt, None, 'director.summarize_context').content
+
     def detect_achievements(self, chat_history, player_name, achievements):
         fmt = self.achievement_parser.get_format_instructions()
         achievement_prompt = f"""
@@ -284,7 +465,7 @@ class Director:
             4. Is the achievement specific and descriptive enough for social media sharing?
 
             # Output Format
-            Return a JSON array with AT MOST 2 achievements. If no truly significant achievement-worthy moments occurred, return an empty array [].
+            Return a JSON object with an "achievements" array of AT MOST 2 achievements and a "confidence" from 0 to 1. If no truly significant achievement-worthy moments occurred, the "achievements" array is empty [].
 
             Each achievement must include:
             - "title": A catchy, social-media-shareable title clearly indicating what the player accomplished
@@ -346,14 +527,9 @@ class Director:
             {fmt}
 
             # Final instructions
-            Think step by step when analyzing the chat history. Identify moments of active player participation first, then evaluate their significance based on the scoring guidelines. Carefully compare potential achievements against past ones to ensure diversity. Return only a valid JSON array without any markdown or additional formatting.
+            Think step by step when analyzing the chat history. Identify moments of active player participation first, then evaluate their significance based on the scoring guidelines. Carefully compare potential achievements against past ones to ensure diversity. Return only a valid JSON object without any markdown or additional formatting.
             """
 
-        messages = [
-            SystemMessage(content=self.system_prompt),
-            HumanMessage(content=achievement_prompt)
-        ]
-        chat_prompt = ChatPromptTemplate.from_messages(messages)
-        chain = chat_prompt | self.llm | self.achievement_parser
-        new_achievements = chain.invoke({})
+        new_achievements = self._run(achievement_prompt, self.achievement_parser, 'director.detect_achievements', PRIORITY_BACKGROUND,
+                                     schema=AchievementsOutput)
         return new_achievements
\ No newline at end of file
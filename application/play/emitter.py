@@ -0,0 +1,53 @@
+import os
+import threading
+from application.play.runtime import stage_runtime
+
+# UI state events landing within this many seconds are merged into one `state_delta`; 0 emits them one by one
+EMIT_BATCH_WINDOW = float(os.getenv('EMIT_BATCH_WINDOW', '0.05'))
+
+# State events and the `state_delta` field each is merged into
+STATE_EVENTS = {
+    'typing_indicator': 'typing',
+    'director_status': 'director',
+    'objective_status': 'objective',
+    'status': 'status',
+}
+
+
+class EmitBatcher:
+    """
+    Coalesces a stage's UI state events for its room. Typing indicators are merged per role,
+    the other state events field by field, and the result goes out as a single `state_delta`
+    at most EMIT_BATCH_WINDOW seconds later. Any other event (dialogue, errors, achievements)
+    first flushes the pending delta and is then emitted at once, so ordering is preserved.
+    """
+    def __init__(self, socketio, room, window=EMIT_BATCH_WINDOW):
+        self.socketio = socketio
+        self.room = room
+        self.window = window
+        self.delta = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def emit(self, event_type, data):
+        field = STATE_EVENTS.get(event_type)
+        if field is None or self.window <= 0:
+            self.flush()
+            self.socketio.emit(event_type, data, room=self.room)
+            return
+        with self._lock:
+            if field == 'typing':
+                self.delta.setdefault('typing', {})[data.get('role')] = data.get('status')
+            else:
+                self.delta[field] = {**self.delta.get(field, {}), **data}
+            if self._timer is None:
+                self._timer = stage_runtime.call_later(self.window, self.flush)
+
+    def flush(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            delta, self.delta = self.delta, {}
+        if delta:
+            self.socketio.emit('state_delta', delta, room=self.room)
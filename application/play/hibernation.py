@@ -0,0 +1,84 @@
+import os
+import threading
+import zlib
+from application.utils.serialization import dumps_bytes, loads
+
+# A stage with no join or player input for this many seconds is hibernated
+STAGE_IDLE_SECONDS = int(os.getenv('STAGE_IDLE_SECONDS', '900'))
+# Most stages kept in memory per worker; the least recently active idle ones are hibernated beyond it
+STAGE_MAX_RESIDENT = int(os.getenv('STAGE_MAX_RESIDENT', '500'))
+# Directory for snapshots on local disk; kept in memory when unset
+STAGE_SNAPSHOT_DIR = os.getenv('STAGE_SNAPSHOT_DIR')
+
+
+class StageHibernator:
+    """
+    Holds hibernated stages as compressed JSON snapshots (see Stage.snapshot), in memory or
+    one file per chat on local disk, so an evicted stage can be rehydrated without reloading
+    the chat, episode, show, messages and achievements from the database.
+    """
+    def __init__(self, directory=STAGE_SNAPSHOT_DIR):
+        self.directory = directory
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chat_id):
+        # chat ids come from clients; one that is not a plain file name never reaches the disk
+        if (not isinstance(chat_id, str) or not chat_id or chat_id in ('.', '..')
+                or any(sep in chat_id for sep in ('/', '\\', os.sep, '\0'))):
+            raise ValueError(f"Invalid chat id for a snapshot: {chat_id!r}")
+        return os.path.join(self.directory, f"{chat_id}.snapshot")
+
+    def save(self, chat_id, snapshot):
+        data = zlib.compress(dumps_bytes(snapshot))
+        if self.directory:
+            tmp = self._path(chat_id) + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(chat_id))
+        else:
+            with self._lock:
+                self._snapshots[chat_id] = data
+        return len(data)
+
+    def take(self, chat_id, user_id=None):
+        """
+        Remove and return the snapshot for a chat, or None. With user_id, a snapshot of
+        another user's chat is left in place and None is returned.
+        """
+        if self.directory:
+            try:
+                path = self._path(chat_id)
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except (FileNotFoundError, ValueError):
+                return None
+        else:
+            with self._lock:
+                data = self._snapshots.get(chat_id)
+            if data is None:
+                return None
+        try:
+            snapshot = loads(zlib.decompress(data))
+        except Exception as e:
+            print(f"Error reading snapshot for chat {chat_id}: {str(e)}")
+            snapshot = None
+        if snapshot and user_id is not None and snapshot.get('user_id') != user_id:
+            return None
+        self.discard(chat_id)
+        return snapshot
+
+    def discard(self, chat_id):
+        if self.directory:
+            try:
+                os.remove(self._path(chat_id))
+            except (FileNotFoundError, ValueError):
+                pass
+        else:
+            with self._lock:
+                self._snapshots.pop(chat_id, None)
+
+
+stage_hibernator = StageHibernator()
@@ -0,0 +1,186 @@
+import atexit
+import os
+import threading
+import time
+import weakref
+from application.database.db import db
+from application.play.runtime import stage_runtime
+from application.play.tracing import stage_tracer
+
+# Buffered messages are written once this many are pending, or this many seconds after the first one
+MESSAGE_FLUSH_SIZE = int(os.getenv('MESSAGE_FLUSH_SIZE', '20'))
+MESSAGE_FLUSH_INTERVAL = float(os.getenv('MESSAGE_FLUSH_INTERVAL', '2'))
+# Longest wait between retries of a failed flush
+MESSAGE_RETRY_MAX_DELAY = 30.0
+# Chat state saves landing within this many seconds of each other are coalesced into one update
+STATE_SAVE_DELAY = float(os.getenv('STATE_SAVE_DELAY', '1'))
+
+# Buffers and state writers with work to flush at shutdown
+_writers = weakref.WeakSet()
+
+
+class MessageBuffer:
+    """
+    Write-behind buffer for a chat's messages. add() numbers each message with the next
+    sequence and returns immediately; pending messages are inserted with add_messages_batch
+    on the stage runtime when the size or time threshold is reached, at turn end, and at
+    shutdown. A failed batch stays at the front of the queue and is retried with backoff.
+    Messages added with a future visible_at (client-paced delivery) are held back until then,
+    so a player interrupt can still retract lines nobody has seen.
+    """
+    def __init__(self, chat_id, next_sequence=0, pending=None):
+        self.chat_id = chat_id
+        self.next_sequence = next_sequence
+        self.pending = list(pending or [])
+        self.retry_delay = 0
+        self.closed = False                 # Set when the stage hibernates; its messages move to a snapshot
+        self._timer = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        _writers.add(self)
+
+    def add(self, role, content, type, visible_at=None):
+        """Queue a message and return its sequence number, or None once the buffer is closed"""
+        with self._lock:
+            if self.closed:
+                # a turn that was still running when its stage hibernated; the rehydrated
+                # stage owns this sequence now
+                print(f"Dropping message for chat {self.chat_id}: buffer is closed")
+                return None
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            message = {'role': role, 'content': content, 'type': type, 'sequence': sequence}
+            if visible_at:
+                message['visible_at'] = visible_at
+            self.pending.append(message)
+            size = len(self.pending)
+        if size >= MESSAGE_FLUSH_SIZE:
+            self.flush_async()
+        else:
+            self._schedule(MESSAGE_FLUSH_INTERVAL)
+        return sequence
+
+    def _schedule(self, delay):
+        with self._lock:
+            if self._timer is None and self.pending:
+                self._timer = stage_runtime.call_later(delay, self.flush)
+
+    def flush_async(self):
+        stage_runtime.submit(self.flush)
+
+    def flush(self, force=False):
+        """Write every pending message that is visible by now (all of them with force);
+        returns False if the batch failed and was requeued"""
+        with self._flush_lock:
+            now = time.time()
+            with self._lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+                batch, held = [], []
+                for message in self.pending:
+                    (held if message.get('visible_at', 0) > now and not force else batch).append(message)
+                self.pending = held
+            if held:
+                self._schedule(min(m['visible_at'] for m in held) - now)
+            if not batch:
+                return True
+            try:
+                with stage_tracer.span('messages.flush', self.chat_id, messages=len(batch)):
+                    db.add_messages_batch(self.chat_id, batch)
+            except Exception as e:
+                print(f"Error writing {len(batch)} messages for chat {self.chat_id}: {str(e)}")
+                with self._lock:
+                    self.pending = batch + self.pending
+                self.retry_delay = min(MESSAGE_RETRY_MAX_DELAY, (self.retry_delay or MESSAGE_FLUSH_INTERVAL / 2) * 2)
+                self._schedule(self.retry_delay)
+                return False
+            self.retry_delay = 0
+            return True
+
+    def retract(self, sequences):
+        """Drop pending messages by sequence (lines withdrawn before they became visible)"""
+        sequences = set(sequences)
+        with self._lock:
+            self.pending = [m for m in self.pending if m['sequence'] not in sequences]
+
+    def close(self):
+        """Refuse further messages; pending ones can still be flushed or snapshotted"""
+        with self._lock:
+            self.closed = True
+
+    def discard(self):
+        """Drop pending messages that now live elsewhere (a stage snapshot) and stop retrying"""
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self.pending = []
+            self.closed = True
+        _writers.discard(self)
+
+
+class ChatStateWriter:
+    """
+    Persists a chat's stage state with dirty-field tracking. save() records only the columns
+    whose value differs from what was last written; weak saves are coalesced into a single
+    update STATE_SAVE_DELAY seconds later, strong saves (objective boundaries) write at once.
+    A failed update keeps its fields dirty and is retried on the next save or flush.
+    """
+    def __init__(self, chat_id, saved=None, dirty=None):
+        self.chat_id = chat_id
+        self.saved = dict(saved or {})
+        self.dirty = dict(dirty or {})
+        self._timer = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        _writers.add(self)
+
+    def save(self, state, strong=False):
+        """Queue the changed fields of `state`; returns False only if a strong save failed"""
+        with self._lock:
+            for field, value in state.items():
+                if field in self.saved and self.saved[field] == value:
+                    self.dirty.pop(field, None)
+                else:
+                    self.dirty[field] = value
+            if not self.dirty:
+                return True
+            if not strong:
+                if self._timer is None:
+                    self._timer = stage_runtime.call_later(STATE_SAVE_DELAY, self.flush)
+                return True
+        return self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+                changes, self.dirty = self.dirty, {}
+            if not changes:
+                return True
+            try:
+                with stage_tracer.span('state.flush', self.chat_id, fields=','.join(sorted(changes))):
+                    db.update_chat(self.chat_id, changes)
+            except Exception as e:
+                print(f"Error saving state for chat {self.chat_id}: {str(e)}")
+                with self._lock:
+                    # fields saved again meanwhile keep their newer value
+                    self.dirty = {**changes, **self.dirty}
+                    if self._timer is None:
+                        self._timer = stage_runtime.call_later(MESSAGE_RETRY_MAX_DELAY, self.flush)
+                return False
+            with self._lock:
+                self.saved.update(changes)
+            return True
+
+
+@atexit.register
+def flush_all_writers():
+    for writer in list(_writers):
+        if isinstance(writer, MessageBuffer):
+            writer.flush(force=True)
+        else:
+            writer.flush()
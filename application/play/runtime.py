@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Under eventlet, stage tasks are green threads and timers live on the hub's timer queue
+try:
+    import eventlet
+    import eventlet.patcher
+    _green = eventlet.patcher.is_monkey_patched('thread')
+except ImportError:
+    _green = False
+
+# Concurrent stage tasks (turns, player input) per worker; further spawns wait for a free slot
+STAGE_MAX_TASKS = int(os.getenv('STAGE_MAX_TASKS', '1000'))
+# Bounded pool for blocking database writes a stage runs beside its turn (message flushes)
+STAGE_WORKERS = int(os.getenv('STAGE_WORKERS', '16'))
+
+
+def _logged(fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        print(f"Error in stage task {getattr(fn, '__name__', fn)}: {str(e)}")
+
+
+class _Timer:
+    """Handle of a call scheduled on the runtime's timer queue"""
+    def __init__(self, when, fn, args):
+        self.when = when
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class StageRuntime:
+    """
+    The one scheduler every stage in this worker runs on: a pool of tasks for turns and
+    player input, a timer queue for next turns and periodic jobs, and a bounded executor
+    for blocking work. With eventlet these are green threads and hub timers, so concurrent
+    chats are bounded by memory rather than OS threads; otherwise a fixed thread pool and a
+    single timer thread stand in.
+    """
+    def __init__(self, max_tasks=STAGE_MAX_TASKS, workers=STAGE_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stage-worker')
+        if _green:
+            self._pool = eventlet.GreenPool(max_tasks)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=max_tasks, thread_name_prefix='stage-task')
+            self._timers = []
+            self._seq = itertools.count()
+            self._timer_wake = threading.Condition()
+            self._timer_thread = None
+
+    def spawn(self, fn, *args, **kwargs):
+        """Run fn as a stage task"""
+        if _green:
+            self._pool.spawn_n(_logged, fn, *args, **kwargs)
+        else:
+            self._pool.submit(_logged, fn, *args, **kwargs)
+
+    def start(self, fn, *args, **kwargs):
+        """
+        Run fn as a stage task and return a Future of its result. Model-bound work (prefetch,
+        speculation) goes here rather than to the executor, so it is bounded only by the LLM
+        scheduler; cancelling the Future before the task starts skips fn.
+        """
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.spawn(run)
+        return future
+
+    def submit(self, fn, *args, **kwargs):
+        """Run blocking work on the bounded executor and return its Future"""
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def call_later(self, delay, fn, *args):
+        """Spawn fn as a stage task after `delay` seconds; returns a handle with cancel()"""
+        if _green:
+            return eventlet.spawn_after(delay, self.spawn, fn, *args)
+        timer = _Timer(time.monotonic() + delay, fn, args)
+        with self._timer_wake:
+            heapq.heappush(self._timers, (timer.when, next(self._seq), timer))
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._run_timers, name='stage-timers', daemon=True)
+                self._timer_thread.start()
+            self._timer_wake.notify()
+        return timer
+
+    def call_every(self, interval, fn, *args):
+        """Spawn fn as a stage task every `interval` seconds"""
+        def tick():
+            self.call_later(interval, tick)
+            fn(*args)
+        return self.call_later(interval, tick)
+
+    def _run_timers(self):
+        while True:
+            with self._timer_wake:
+                while not self._timers or self._timers[0][0] > time.monotonic():
+                    self._timer_wake.wait(self._timers[0][0] - time.monotonic() if self._timers else None)
+                _, _, timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                self.spawn(timer.fn, *timer.args)
+
+
+# Process-wide runtime shared by every stage
+stage_runtime = StageRuntime()
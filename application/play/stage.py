@@ -1,27 +1,142 @@
-import json
 import re
 import time
 import threading
 import math
+import os
 from application.database.db import db
 from application.play.player import Player
 from application.play.actor import Actor
 from application.play.director import Director
+from application.play.context import ContextWindow
+from application.play.runtime import stage_runtime
+from application.play.cast import cast_cache
+from application.play.persistence import MessageBuffer, ChatStateWriter
+from application.play.tracing import stage_tracer
+from application.play.emitter import EmitBatcher
+from application.utils.serialization import loads
+from application.jobs.jobs import job_queue
 from application.ai.llm import actor_llm, director_llm
+from application.ai.scheduler import PRIORITY_INTERRUPT, PRIORITY_TURN, PRIORITY_OBJECTIVE
+
+# Stream actor lines to the room as `dialogue_chunk` events before the final `dialogue`
+STREAM_DIALOGUE = os.getenv('STREAM_DIALOGUE', 'False').lower() == 'true'
+
+# Stream the director's script and start each line as soon as its step is written
+STREAM_SCRIPT = os.getenv('STREAM_SCRIPT', 'False').lower() == 'true'
+
+# 'server': the stage waits out each line's typing delay before emitting it.
+# 'client': lines are emitted as soon as they are written, with a display_at time the client paces them to.
+LINE_DELIVERY = os.getenv('LINE_DELIVERY', 'server').lower()
+# With client delivery, how many seconds the emitted lines may run ahead of what the player has seen
+LINE_LOOKAHEAD = float(os.getenv('LINE_LOOKAHEAD', '10'))
+
+# Chat row columns that hold the stage's progress
+CHAT_STATE_FIELDS = ('current_objective_index', 'plot_failure_reason', 'context', 'chat_summary',
+                     'last_script_data', 'last_outline', 'story_completed')
+
+# 'standard': the director writes instructions and each actor writes its own line.
+# 'ensemble': the director writes every line of the turn in one call; the stage only paces them.
+STAGE_MODES = ('standard', 'ensemble')
+
+
+def detect_player_achievements(payload):
+    """Body of the detect_achievements job: store and return the achievements the chat has not earned yet"""
+    player = Player(name=payload['player_name'], description=payload.get('player_description', ''))
+    director = Director(director_llm, payload['show'], payload['description'], payload['background'],
+                        dict(payload.get('characters') or {}), player, payload['relations'],
+                        payload['chat_id'], payload['user_id'])
+    detected = director.detect_achievements(payload['chat_history'], payload['player_name'], payload['achievements'])
+    # compare with the stored titles, so a retried job does not award the same achievement twice
+    titles = {existing.get('title') for existing in db.get_achievements(chat_id=payload['chat_id'])}
+    new_achievements = []
+    for achievement in detected.get('achievements', []):
+        if achievement['title'] in titles:
+            continue
+        db.add_achievement(payload['chat_id'], achievement['title'], achievement['score'])
+        titles.add(achievement['title'])
+        new_achievements.append(achievement)
+    return new_achievements
+
+
+class ScriptFeed:
+    """
+    Script steps arriving from a streaming director call. A stage task drains the stream so
+    the director keeps writing while lines are performed; the stage iterates the steps in
+    order, waiting for the next one, and can index the steps received so far for prefetching.
+    """
+    def __init__(self, steps):
+        self.steps = []
+        self.done = False
+        self.error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        stage_runtime.spawn(self._drain, steps)
+
+    def _drain(self, steps):
+        try:
+            for step in steps:
+                if self._closed:
+                    break
+                with self._condition:
+                    self.steps.append(step)
+                    self._condition.notify_all()
+        except Exception as e:
+            print(f"Error streaming director script: {str(e)}")
+            self.error = e
+        finally:
+            # closing the generator here, on the thread running it, cancels the model call
+            steps.close()
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    def close(self):
+        """Stop the stream at its next step and end iteration at once"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __getitem__(self, index):
+        return self.steps[index]
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.steps) and not self.done and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                if index >= len(self.steps):
+                    if self.error and not self.steps:
+                        raise self.error
+                    return
+                step = self.steps[index]
+            yield step
+            index += 1
 
 
 class Stage:
-    def __init__(self, actors=None, director=None, socketio=None, chat_id=None):
-        """Initialize a Stage with actors/director or load from database with chat_id"""
+    def __init__(self, actors=None, director=None, socketio=None, chat_id=None, chat_data=None):
+        """Initialize a Stage with actors/director or load from database with chat_id.
+        chat_data is a db.get_stage_bootstrap row the caller already fetched"""
         self.socketio = socketio
         self._gen = 0
         self.dialogue_history = []
         self.is_processing = False
+        self.last_active_at = time.time()             # Last join or player input, for idle hibernation
 
         # Thread management and cancellation
         self.active_threads = {}                    # Track active threads by ID
         self.cancellation_event = threading.Event() # Event for signaling cancellation
-        self.next_turn_timer = None                 # Handle to the next-turn timer
+        self._wake = threading.Condition()          # Wakes timed waits on cancellation or a new generation
+        self.next_turn_timer = None                 # Handle to the next turn on the stage runtime's timer queue
+        self.prefetched_line = None                 # Next actor line generated ahead of time
+        self.script_feed = None                     # Director script still streaming for the current turn
+        self.speculative_outline = None             # Next objective's outline generated ahead of time
 
         # Story state
         self.story_completed = False
@@ -29,20 +144,37 @@ class Stage:
         self.player_interrupted = False
         self.plot_objectives = []
         self.current_objective_index = 0
-        self.context = ""
+        self.context = ContextWindow(summarizer=self._summarize_context)
+        self.initial_setup_pending = False
         self.chat_speed = 2.25
+        self.stream_dialogue = STREAM_DIALOGUE
+        self.stream_script = STREAM_SCRIPT
+        self.line_delivery = LINE_DELIVERY
+        self.visible_until = 0.0                # When the client shows the last emitted line
+        self.unseen_lines = []                  # Emitted lines not shown yet, retracted on player input
+        self.stage_mode = 'standard'
         self.plot_failure_reason = ''
         self.chat_summary = ''
         self.last_script_data = None
         self.last_outline = None
         self.background = ''
         self.initial_setup = ''
+        self.cast = None                        # Show/episode data shared with other stages of the episode
+        self.show = ''
+        self.description = ''
+        self.characters = ()
+        self.relations = ''
         self.chat_id = None
+        self.user_id = None
+        self.turn_priority = PRIORITY_TURN      # LLM priority of the current turn's lines
         self.achievements = []
+        self.messages = None                    # Write-behind buffer for this chat's messages
+        self.emitter = None                     # Coalesces UI state events into state_delta
+        self.state_writer = None                # Dirty-tracking, coalescing writer for the chat row
 
         if chat_id:
             try:
-                self._load_from_database(chat_id)
+                self._load_from_database(chat_id, chat_data)
             except Exception as e:
                 print(f"Error loading chat: {str(e)}")
                 self.emit_event('error', {"message": f"Error loading chat: {str(e)}"}, self._gen)
@@ -51,39 +183,35 @@ class Stage:
             self.actors = actors
             self.director = director
 
-    def _parse_json_field(self, field):
-        try:
-            if isinstance(field, str):
-                return json.loads(field)
-            return field or []
-        except json.JSONDecodeError:
-            return []
-
-    def _load_from_database(self, chat_id):
-        """Load stage data from database with error handling"""
+    def _load_from_database(self, chat_id, chat_data=None):
+        """Load stage data from database with error handling (one round trip, or none if chat_data is given)"""
         self.chat_id = chat_id
-        chat_data = db.get_chat(chat_id)
+        if chat_data is None or 'messages' not in chat_data:
+            chat_data = db.get_stage_bootstrap(chat_id)
         if not chat_data:
             raise ValueError(f"Chat with ID {chat_id} not found in database")
 
         self.current_objective_index = chat_data.get('current_objective_index', 0)
         self.plot_failure_reason = chat_data.get('plot_failure_reason', '')
-        self.context = chat_data.get('context', '')
+        self.initial_setup_pending = chat_data.get('context') is None
+        self.context.load(chat_data.get('context'))
         self.chat_summary = chat_data.get('chat_summary', '')
         self.last_script_data = chat_data.get('last_script_data')
         self.last_outline = chat_data.get('last_outline')
         self.story_completed = chat_data.get('story_completed', False) or chat_data.get('completed', False)
         self.chat_speed = chat_data.get('chat_speed', 2.25)
+        self.user_id = chat_data.get('user_id')
         player_name = chat_data.get('player_name', 'Player')
         player_description = chat_data.get('player_description', '')
         self.player = Player(name=player_name, description=player_description)
 
         episode_id = chat_data.get('episode_id')
-        episode_data = db.get_episode(episode_id)
+        episode_data = chat_data.get('episodes')
         if not episode_data:
             raise ValueError(f"Episode with ID {episode_id} not found in database")
 
-        self.plot_objectives = self._parse_json_field(episode_data.get('plot_objectives', '[]'))
+        stage_mode = chat_data.get('stage_mode') or episode_data.get('stage_mode')
+        self.stage_mode = stage_mode if stage_mode in STAGE_MODES else 'standard'
         self.initial_setup = episode_data.get('background', '')
         if self.chat_summary:
             self.background = self.chat_summary
@@ -91,26 +219,15 @@ class Stage:
             self.background = episode_data.get('background', '')
 
         show_id = episode_data.get('show_id')
-        show_data = db.get_show(show_id)
+        show_data = episode_data.get('shows')
         if not show_data:
             raise ValueError(f"Show with ID {show_id} not found in database")
 
-        self.show = show_data.get('name', '')
-        self.description = show_data.get('description', '')
+        self._build_cast(cast_cache.for_episode(show_id, episode_id, show_data, episode_data))
 
-        characters = self._parse_json_field(show_data.get('characters', '[]'))
-        relations = show_data.get('relations', '')
-        self.actors = {}
-        for character in characters:
-            char_name = character.get('name') if isinstance(character, dict) else character.name
-            char_name = char_name.strip().lower() 
-            char_desc = character.get('description') if isinstance(character, dict) else character.description
-            self.actors[char_name] = Actor(char_name, char_desc, relations, self.background, actor_llm)
-
-        self.director = Director(director_llm, self.show, self.description,
-                                 self.background, self.actors, self.player, relations)
-
-        messages = db.get_messages(self.chat_id)
+        messages = chat_data.get('messages')
+        self.state_writer = ChatStateWriter(chat_id, {field: chat_data.get(field) for field in CHAT_STATE_FIELDS})
+        self.messages = MessageBuffer(chat_id, max((msg.get('sequence') or 0 for msg in messages or []), default=-1) + 1)
         if messages:
             self.dialogue_history = []
             for msg in messages:
@@ -119,10 +236,94 @@ class Stage:
                     prefix = 'Narration:' if msg['type']=='narration' else msg['role']+':'
                     line = f"{prefix} {msg['content']}"
         
-        achievements = db.get_achievements(self.chat_id)
+        achievements = chat_data.get('achievements')
         if achievements:
             self.achievements = achievements
 
+    def _build_cast(self, cast):
+        """Create this stage's actors and director on top of a shared cast bundle"""
+        self.cast = cast
+        self.show = cast.show
+        self.description = cast.description
+        self.characters = cast.characters
+        self.relations = cast.relations
+        self.plot_objectives = cast.plot_objectives
+        self.actors = {}
+        for char_name, char_desc in cast.characters:
+            self.actors[char_name] = Actor(char_name, char_desc, cast.relations, self.background, actor_llm,
+                                           self.chat_id, self.user_id, cast.actor_prompt(char_name, self.background))
+
+        self.director = Director(director_llm, self.show, self.description, self.background, self.actors, self.player,
+                                 cast.relations, self.chat_id, self.user_id, cast.director_prompt(self.background))
+
+    def snapshot(self):
+        """JSON-serializable state of the stage, for hibernating it while idle"""
+        return {
+            'chat_id': self.chat_id,
+            'user_id': self.user_id,
+            'show_id': self.cast.show_id,
+            'episode_id': self.cast.episode_id,
+            'cast_version': self.cast.version,
+            'show': self.show,
+            'description': self.description,
+            'characters': self.characters,
+            'relations': self.relations,
+            'player': {'name': self.player.name, 'description': self.player.description},
+            'plot_objectives': self.plot_objectives,
+            'current_objective_index': self.current_objective_index,
+            'plot_failure_reason': self.plot_failure_reason,
+            'context': self.context.render(),
+            'initial_setup_pending': self.initial_setup_pending,
+            'initial_setup': self.initial_setup,
+            'chat_summary': self.chat_summary,
+            'last_script_data': self.last_script_data,
+            'last_outline': self.last_outline,
+            'story_completed': self.story_completed,
+            'chat_speed': self.chat_speed,
+            'stage_mode': self.stage_mode,
+            'dialogue_history': self.dialogue_history,
+            'achievements': self.achievements,
+            'next_sequence': self.messages.next_sequence,
+            'pending_messages': self.messages.pending,
+            'saved_state': self.state_writer.saved,
+            'unsaved_state': self.state_writer.dirty,
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot, socketio=None):
+        """Rehydrate a hibernated stage without going back to the database"""
+        stage = cls(socketio=socketio)
+        stage.chat_id = snapshot['chat_id']
+        stage.user_id = snapshot.get('user_id')
+        player = snapshot.get('player') or {}
+        stage.player = Player(name=player.get('name', 'Player'), description=player.get('description', ''))
+        stage.current_objective_index = snapshot.get('current_objective_index', 0)
+        stage.plot_failure_reason = snapshot.get('plot_failure_reason', '')
+        stage.context.load(snapshot.get('context'))
+        stage.initial_setup_pending = snapshot.get('initial_setup_pending', False)
+        stage.initial_setup = snapshot.get('initial_setup', '')
+        stage.chat_summary = snapshot.get('chat_summary', '')
+        stage.background = stage.chat_summary or stage.initial_setup
+        stage.last_script_data = snapshot.get('last_script_data')
+        stage.last_outline = snapshot.get('last_outline')
+        stage.story_completed = snapshot.get('story_completed', False)
+        stage.chat_speed = snapshot.get('chat_speed', 2.25)
+        stage.stage_mode = snapshot.get('stage_mode', 'standard')
+        stage.dialogue_history = snapshot.get('dialogue_history', [])
+        stage.achievements = snapshot.get('achievements', [])
+        stage.messages = MessageBuffer(stage.chat_id, snapshot.get('next_sequence', 0), snapshot.get('pending_messages'))
+        # the writer resumes knowing only what was actually written; older snapshots without it rewrite every field
+        stage.state_writer = ChatStateWriter(stage.chat_id, snapshot.get('saved_state'), snapshot.get('unsaved_state'))
+        stage._build_cast(cast_cache.restore(snapshot.get('show_id'), snapshot.get('episode_id'), snapshot.get('cast_version'),
+                                             snapshot.get('show', ''), snapshot.get('description', ''),
+                                             snapshot.get('characters', []), snapshot.get('relations', ''),
+                                             snapshot.get('plot_objectives', []), stage.initial_setup))
+        return stage
+
+    def _summarize_context(self, summary, lines):
+        """Fold lines that fell out of the context budget into the running scene summary"""
+        return self.director.summarize_context(summary, lines)
+
     def _clean_json(self, json_str):
         cleaned = json_str.strip()
         if cleaned.startswith("```") and cleaned.endswith("```"):
@@ -133,32 +334,41 @@ class Stage:
         cleaned = re.sub(r",\s*([\]}])", r"\1", cleaned)
         return cleaned
 
-    def save_state_to_db(self):
-        if not self.chat_id:
-            self.emit_event('error', {"message": "Cannot save state: no chat_id provided"}, self._gen)
-            return False
-        chat_data = {
+    def _state(self):
+        return {
             'current_objective_index': self.current_objective_index,
             'plot_failure_reason': self.plot_failure_reason,
-            'context': self.context,
+            'context': self.context.render(),
             'chat_summary': self.chat_summary,
             'last_script_data': self.last_script_data,
             'last_outline': self.last_outline,
             'story_completed': self.story_completed
         }
-        try:
-            db.update_chat(self.chat_id, chat_data)
-            return True
-        except Exception as e:
-            print(f"Error saving state: {str(e)}")
-            self.emit_event('error', {"message": f"Error saving state: {str(e)}"}, self._gen)
+
+    def save_state_to_db(self, strong=False):
+        """Save changed state fields; coalesced with nearby saves unless strong"""
+        if not self.chat_id:
+            self.emit_event('error', {"message": "Cannot save state: no chat_id provided"}, self._gen)
             return False
+        with self._span('state_save', self._gen, strong=strong):
+            saved = self.state_writer.save(self._state(), strong)
+        if saved:
+            return True
+        self.emit_event('error', {"message": "Error saving state"}, self._gen)
+        return False
+
+    def _span(self, name, gen, **attributes):
+        """Trace span tagged with this stage's chat, the given generation and the current objective"""
+        return stage_tracer.span(name, self.chat_id, gen, self.current_objective_index, **attributes)
 
     def emit_event(self, event_type, data, gen):
         # only emit if this worker is still on the current generation
         if gen == self._gen and self.socketio:
+            stage_tracer.event('emit', event_type=event_type)
             try:
-                self.socketio.emit(event_type, data, room=self.chat_id)
+                if self.emitter is None or self.emitter.room != self.chat_id:
+                    self.emitter = EmitBatcher(self.socketio, self.chat_id)
+                self.emitter.emit(event_type, data)
             except Exception:
                 print(f"Error emitting event: {event_type}")
 
@@ -166,9 +376,16 @@ class Stage:
         """Cancel all running operations and clear pending timer"""
         my_gen = self._gen
         self.cancellation_event.set()
+        self._interrupt_waits()
         if self.next_turn_timer:
             self.next_turn_timer.cancel()
             self.next_turn_timer = None
+        self._discard_prefetch()
+        self._discard_speculative_outline()
+        if self.script_feed:
+            # wakes a turn waiting for the next streamed step
+            self.script_feed.close()
+            self.script_feed = None
         self.is_processing = False
 
         for tid, thread_info in list(self.active_threads.items()):
@@ -176,111 +393,298 @@ class Stage:
                 self.active_threads.pop(tid, None)
         # notify only old generation
         self.emit_event('status', {"message": "Processing interrupted and stopped"}, my_gen)
+        # these are coalesced into a single state_delta by the stage's emitter
         for role in self.actors:
             self.emit_event('typing_indicator', {"role": role, "status": "idle"}, my_gen)
-            self.emit_event('typing_indicator', {"role": role.lower(), "status": "idle"}, my_gen - 1 )
         self.emit_event('typing_indicator', {"role": "Narration", "status": "idle"},my_gen)
         self.emit_event('director_status', {"status": "idle", "message": ""}, my_gen)
         self.emit_event('status', {"message": "Scene reset for player input"}, my_gen)
 
+    def _wait(self, gen, timeout):
+        """Block for up to `timeout` seconds without polling.
+        Returns True as soon as the stage is cancelled or moves past generation `gen`"""
+        deadline = time.monotonic() + timeout
+        with self._wake:
+            while not (self.cancellation_event.is_set() or gen != self._gen):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._wake.wait(remaining)
+        return True
+
+    def _interrupt_waits(self):
+        with self._wake:
+            self._wake.notify_all()
+
+    def _line_kind(self, role):
+        """Classify a script role as 'player', 'actor', 'narration' or 'other'"""
+        if role == (self.player.name.lower() if self.player else 'player'):
+            return 'player'
+        if role in [actor.name.lower() for actor in self.actors.values()]:
+            return 'actor'
+        if role == 'narration':
+            return 'narration'
+        return 'other'
+
+    def _actor_for(self, role):
+        return self.actors.get(role) or Actor(role, '', '', self.background, actor_llm, self.chat_id, self.user_id)
+
+    def _prefetch_next_line(self, steps, index, context, gen):
+        """Start writing the next spoken line against the context as it will stand once line `index` lands"""
+        for offset in range(index + 1, len(steps)):
+            line = steps[offset]
+            role = line.get('role', '').strip().lower()
+            kind = self._line_kind(role)
+            if kind == 'narration':
+                content = line.get('content') or line.get('line', '')
+                context = f"{context}\nNarration: {content}" if context else f"Narration: {content}"
+                continue
+            if kind == 'player' or line.get('line'):
+                return
+
+            actor = self._actor_for(role)
+            instructions = line.get('instruction') or line.get('content', '')
+            # the turn's priority, captured now since the next turn may change it
+            priority = self.turn_priority
+
+            def run():
+                if self.cancellation_event.is_set() or gen != self._gen:
+                    return None
+                return actor.reply(context, instructions, priority)
+
+            self.prefetched_line = {'index': offset, 'gen': gen, 'context': context,
+                                    'future': stage_runtime.start(run)}
+            return
+
+    def _discard_prefetch(self):
+        if self.prefetched_line:
+            self.prefetched_line['future'].cancel()
+            self.prefetched_line = None
+
+    def _take_prefetched(self, index, gen):
+        """Return the prefetched reply for line `index` if it is still valid for this generation and context"""
+        prefetched, self.prefetched_line = self.prefetched_line, None
+        if not prefetched:
+            return None
+        if (prefetched['index'] != index or prefetched['gen'] != gen or gen != self._gen
+                or self.cancellation_event.is_set() or prefetched['context'] != self.context.render()):
+            prefetched['future'].cancel()
+            return None
+        # a prefetch that has not started yet is no head start; the line is written inline instead
+        if prefetched['future'].cancel():
+            return None
+        try:
+            return prefetched['future'].result()
+        except Exception as e:
+            print(f"Error prefetching line: {str(e)}")
+            return None
+
+    def _generate_reply(self, actor, role, instructions, entry_type, index, seq, gen, scripted=None):
+        """Get an actor's line, pushing chunks to the room as they arrive in streaming mode"""
+        if scripted:
+            return scripted
+        reply = self._take_prefetched(index, gen)
+        if reply:
+            return reply
+        if not self.stream_dialogue:
+            return actor.reply(self.context, instructions, self.turn_priority)
+        parts = []
+        for chunk in actor.stream_reply(self.context, instructions, self.turn_priority):
+            parts.append(chunk)
+            self.emit_event('dialogue_chunk', {"role": role, "content": chunk, "type": entry_type, "sequence": seq}, gen)
+        return ''.join(parts).strip()
+
+    def _record_line(self, entry, gen):
+        """Append a finished line to the history and context and emit it"""
+        role, content = entry['role'], entry['content']
+        # the player sees the line first; bookkeeping follows
+        self.emit_event('typing_indicator', {"role": role, "status": "idle"}, gen)
+        self.emit_event('dialogue', entry, gen)
+        self.dialogue_history.append(f"{role}: {content}")
+        self.context.append(role, content)
+
+    def _perform_line(self, actor, role, instructions, entry_type, index, seq, gen, steps=(), scripted=None):
+        """Generate (unless the director already wrote it), pace and emit a single actor line.
+        Returns (entry, interrupted)"""
+        with self._span('line', gen, role=role, index=index, type=entry_type):
+            self.emit_event('typing_indicator', {"role": role, "status": "typing"}, gen)
+            started = time.time()
+            with self._span('line.generate', gen, scripted=bool(scripted)):
+                reply = self._generate_reply(actor, role, instructions, entry_type, index, seq, gen, scripted)
+            # the next line is written while this one plays out its typing delay
+            self._prefetch_next_line(steps, index, self.context.render_with(role, reply), gen)
+            entry = {"role": role, "content": reply, "type": entry_type}
+
+            # typing delay; streamed lines have already been typing while they arrived
+            delay = math.floor(len(reply.split()) / self.chat_speed) if index != 0 else 0
+            if self.stream_dialogue:
+                delay -= time.time() - started
+
+            if self.line_delivery == 'client':
+                if self.cancellation_event.is_set() or gen != self._gen:
+                    return entry, True
+                self._deliver_line(entry, max(0, delay), gen)
+                return entry, False
+
+            # a cancelled or superseded turn (hibernation, player input) must not write the line it was
+            # generating; player input clears the event once it has moved to a new generation
+            if self.cancellation_event.is_set() or gen != self._gen:
+                return entry, True
+            self.messages.add(role, reply, entry_type)
+            if index != 0:
+                with self._span('line.pacing', gen, delay=delay):
+                    interrupted = self._wait(gen, delay)
+                if interrupted:
+                    self._record_line(entry, self._gen)
+                    return entry, True
+
+            self._record_line(entry, gen)
+            return entry, False
+
+    def _deliver_line(self, entry, typing_duration, gen):
+        """Emit a line at once, for the client to show after `typing_duration` seconds of typing
+        that start when the lines before it have been shown"""
+        now = time.time()
+        display_at = max(now, self.visible_until) + typing_duration
+        self.visible_until = display_at
+        sequence = self.messages.add(entry['role'], entry['content'], entry['type'], visible_at=display_at)
+        self.unseen_lines = [line for line in self.unseen_lines if line['display_at'] > now]
+        self.unseen_lines.append({'sequence': sequence, 'display_at': display_at,
+                                  'line': f"{entry['role']}: {entry['content']}"})
+        self._record_line({**entry, "sequence": sequence, "display_at": display_at,
+                           "typing_duration": typing_duration, "server_time": now}, gen)
+
+    def _retract_unseen_lines(self):
+        """Withdraw client-paced lines the player has not seen yet from the context, history and message buffer"""
+        now = time.time()
+        unseen = [line for line in self.unseen_lines if line['display_at'] > now]
+        self.unseen_lines = []
+        self.visible_until = now
+        if not unseen:
+            return
+        lines = [line['line'] for line in unseen]
+        self.context.retract(lines)
+        for line in reversed(lines):
+            if not self.dialogue_history or self.dialogue_history[-1] != line:
+                break
+            self.dialogue_history.pop()
+        sequences = [line['sequence'] for line in unseen]
+        if self.messages:
+            self.messages.retract(sequences)
+        self.emit_event('dialogue_retracted', {"sequences": sequences}, self._gen)
+
+    def _speculate_next_outline(self, gen):
+        """Start outlining the next objective now, in case the objective check passes"""
+        next_index = self.current_objective_index + 1
+        if next_index >= len(self.plot_objectives):
+            return None
+        context = self.context.render()
+        objective = self.plot_objectives[next_index]
+
+        def run():
+            if self.cancellation_event.is_set() or gen != self._gen:
+                return None
+            return self.director.generate_outline(context, objective, PRIORITY_OBJECTIVE)
+
+        return {'index': next_index, 'context': context, 'future': stage_runtime.start(run)}
+
+    def _discard_speculative_outline(self):
+        if self.speculative_outline:
+            self.speculative_outline['future'].cancel()
+            self.speculative_outline = None
+
+    def _take_speculative_outline(self):
+        """Return the speculative outline if it was made for the current objective and context"""
+        speculative, self.speculative_outline = self.speculative_outline, None
+        if not speculative:
+            return None
+        if speculative['index'] != self.current_objective_index or speculative['context'] != self.context.render():
+            speculative['future'].cancel()
+            return None
+        if speculative['future'].cancel():
+            return None
+        try:
+            return speculative['future'].result()
+        except Exception as e:
+            print(f"Error in speculative outline: {str(e)}")
+            return None
+
     def process_director_script(self, script_json, gen):
         dialogue_lines = []
         script_data = script_json
-        seq = len(self.dialogue_history)
+        seq = self.messages.next_sequence
+
+        # a ScriptFeed is still being written while its first lines are performed
+        steps = script_data if isinstance(script_data, ScriptFeed) else script_data.get('scripts', [])
 
-        for index, line in enumerate(script_data.get('scripts', [])):
+        for index, line in enumerate(steps):
             # drop out if cancelled or superseded
             if self.cancellation_event.is_set() or gen != self._gen:
+                self._discard_prefetch()
+                return dialogue_lines
+
+            # with client delivery, stay at most LINE_LOOKAHEAD seconds ahead of the player
+            ahead = self.visible_until - time.time() - LINE_LOOKAHEAD
+            if ahead > 0 and self._wait(gen, ahead):
+                self._discard_prefetch()
                 return dialogue_lines
 
             role = line.get('role', '').strip().lower() 
             instructions = line.get('instruction') or line.get('content', '')
+            kind = self._line_kind(role)
 
-            if role.lower() == (self.player.name.lower() if self.player else 'player'):
+            if kind == 'player':
                 self.emit_event('player_action', {"role": role,
                                                   "content": instructions,
                                                   "type": "player_prompt",
                                                   "wait_for_response": True}, gen)
-                start = time.time()
-                while time.time() - start < 10:
-                    if self.cancellation_event.is_set() or gen != self._gen:
-                        return dialogue_lines
-
-            elif role.lower() in [actor.name.lower() for actor in self.actors.values()]:
-                self.emit_event('typing_indicator', {"role": role, "status": "typing"}, gen)
-                actor = self.actors.get(role) 
-                reply = actor.reply(self.context, instructions)
-                db.add_message(self.chat_id, role, reply, "actor_dialogue", seq)
-
-                # simulate typing delay
-                if index != 0:
-                    start = time.time()
-                    while time.time() - start < math.floor(len(reply.split()) / self.chat_speed):
-                        if self.cancellation_event.is_set() or gen != self._gen:
-                            entry = {"role": role, "content": reply, "type": "actor_dialogue"}
-                            dialogue_lines.append(entry)
-                            self.dialogue_history.append(f"{role}: {reply}")
-                            self.context = f"{self.context}\n{role}: {reply}" if self.context else f"{role}: {reply}"
-                            self.emit_event('typing_indicator', {"role": role, "status": "idle"}, self._gen)
-                            self.emit_event('dialogue', entry, self._gen)
-                            seq += 1
-                            return dialogue_lines
-                        time.sleep(0.1)
-
-                entry = {"role": role, "content": reply, "type": "actor_dialogue"}
+                # the player gets 10 seconds once the lines before the prompt are shown
+                if self._wait(gen, max(0, self.visible_until - time.time()) + 10):
+                    self._discard_prefetch()
+                    return dialogue_lines
+
+            elif kind == 'actor':
+                actor = self.actors.get(role)
+                entry, interrupted = self._perform_line(actor, role, instructions, "actor_dialogue", index, seq, gen, steps, line.get('line'))
                 dialogue_lines.append(entry)
-                self.dialogue_history.append(f"{role}: {reply}")
-                self.context = f"{self.context}\n{role}: {reply}" if self.context else f"{role}: {reply}"
-                self.emit_event('typing_indicator', {"role": role, "status": "idle"}, gen)
-                self.emit_event('dialogue', entry, gen)
                 seq += 1
+                if interrupted:
+                    self._discard_prefetch()
+                    return dialogue_lines
 
-            elif role.lower() == 'narration':
-                self.emit_event('typing_indicator', {"role": "Narration", "status": "typing"}, gen)
-                content = line.get('content', '')
+            elif kind == 'narration':
+                content = line.get('content') or line.get('line', '')
                 entry = {"role": "Narration", "content": content, "type": "narration"}
                 dialogue_lines.append(entry)
+                seq += 1
+                if self.line_delivery == 'client':
+                    self._deliver_line(entry, 0, gen)
+                    continue
+                self.emit_event('typing_indicator', {"role": "Narration", "status": "typing"}, gen)
                 self.dialogue_history.append(f"Narration: {content}")
-                self.context = f"{self.context}\nNarration: {content}" if self.context else f"Narration: {content}"
-                db.add_message(self.chat_id, "Narration", content, "narration", seq)
+                self.context.append("Narration", content)
+                self.messages.add("Narration", content, "narration")
                 self.emit_event('typing_indicator', {"role": "Narration", "status": "idle"}, gen)
                 self.emit_event('dialogue', entry, gen)
-                seq += 1
 
             else:
                 # other roles
-                self.emit_event('typing_indicator', {"role": role, "status": "typing"}, gen)
-                actor = Actor(role, '', '', self.background, actor_llm)
-                reply = actor.reply(self.context, instructions)
-                db.add_message(self.chat_id, role, reply, "other", seq)
-
-                if index != 0:
-                    start = time.time()
-                    while time.time() - start < math.floor(len(reply.split()) / self.chat_speed):
-                        if self.cancellation_event.is_set() or gen != self._gen:
-                            entry = {"role": role, "content": reply, "type": "other"}
-                            dialogue_lines.append(entry)
-                            self.dialogue_history.append(f"{role}: {reply}")
-                            self.context = f"{self.context}\n{role}: {reply}" if self.context else f"{role}: {reply}"
-                            self.emit_event('typing_indicator', {"role": role, "status": "idle"}, self._gen)
-                            self.emit_event('dialogue', entry, self._gen)
-                            seq += 1
-                            return dialogue_lines
-
-                entry = {"role": role, "content": reply, "type": "other"}
+                actor = Actor(role, '', '', self.background, actor_llm, self.chat_id, self.user_id)
+                entry, interrupted = self._perform_line(actor, role, instructions, "other", index, seq, gen, steps, line.get('line'))
                 dialogue_lines.append(entry)
-                self.dialogue_history.append(f"{role}: {reply}")
-                self.context = f"{self.context}\n{role}: {reply}" if self.context else f"{role}: {reply}"
-                self.emit_event('typing_indicator', {"role": role, "status": "idle"}, gen)
-                self.emit_event('dialogue', entry, gen)
                 seq += 1
+                if interrupted:
+                    self._discard_prefetch()
+                    return dialogue_lines
 
+        self._discard_prefetch()
         if self.chat_id:
+            self.messages.flush_async()
             self.save_state_to_db()
         return dialogue_lines
 
     def trigger_next_turn(self):
-        """Trigger next turn in its own thread"""
+        """Trigger next turn as a task on the shared stage runtime"""
         # don't start if another run is in progress or cancelled
         if self.cancellation_event.is_set() or self.is_processing:
             return
@@ -301,13 +705,14 @@ class Stage:
                 return
 
             # perform the turn
-            self.advance_turn(my_gen)
+            with self._span('turn', my_gen):
+                self.advance_turn(my_gen)
 
             # cleanup
             self.is_processing = False
             self.active_threads.pop(tid, None)
 
-        threading.Thread(target=run, daemon=True).start()
+        stage_runtime.spawn(run)
 
     def advance_turn(self, gen):
         """Advance the game turn based on current objective or handle player interrupt"""
@@ -326,17 +731,20 @@ class Stage:
                 return {"status": "cancelled", "message": "Turn cancelled by player", "dialogue": []}
 
             self.emit_event('director_status', {"status": "directing", "message": "Director is directing..."}, gen)
+            # replanning for a player interrupt jumps the LLM queue
+            self.turn_priority = PRIORITY_INTERRUPT if self.player_interrupted else PRIORITY_TURN
 
-            if self.current_objective_index == 0 and self.context == None:
+            if self.current_objective_index == 0 and self.initial_setup_pending:
                 entry = {"role": "Narration", "content": self.initial_setup, "type": "narration"}
                 self.emit_event('dialogue', entry, self._gen)
+                self.initial_setup_pending = False
                 
 
             # check completion
             if self.current_objective_index >= len(self.plot_objectives):
                 self.story_completed = True
                 if self.chat_id:
-                    self.save_state_to_db()
+                    self.save_state_to_db(strong=True)
                 self.emit_event('status', {"message": "No current objective. Story complete."}, gen)
                 self.emit_event('objective_status', {
                     "message": "All objectives have been completed! Story is finished.",
@@ -350,14 +758,17 @@ class Stage:
             # outline generation or reuse
             self.emit_event('director_status', {"status": "directing", "message": "Director is writing next scene..."}, gen)
             if not self.plot_failure_reason and not self.player_interrupted:
-                outline_str = self.director.generate_outline(self.context, self.plot_objectives[self.current_objective_index])
+                with self._span('outline', gen) as span:
+                    outline_str = self._take_speculative_outline()
+                    span['attributes']['speculative'] = bool(outline_str)
+                    outline_str = outline_str or self.director.generate_outline(self.context, self.plot_objectives[self.current_objective_index])
                 outline = outline_str
-                self.context = ''
+                self.context.clear()
                 self.director.background = self.chat_summary
                 for actor_name in self.actors:
                     self.actors[actor_name].background = self.chat_summary
             else:
-                outline = self.last_outline if isinstance(self.last_outline, dict) else json.loads(self._clean_json(self.last_outline))
+                outline = self.last_outline if isinstance(self.last_outline, dict) else loads(self._clean_json(self.last_outline))
 
             # writing next scene
             self.last_outline = outline
@@ -369,41 +780,49 @@ class Stage:
                 self.player_interrupted = False
             else:
                 self.emit_event('director_status', {"status": "directing", "message": "Director is cueing the actors..."}, gen)
-            script_json = self.director.generate_turn_instructions(self.context, outline.get('new_outline', outline), self.plot_failure_reason,self.plot_objectives[self.current_objective_index])
+            with self._span('turn_instructions', gen, mode=self.stage_mode, streamed=self.stream_script):
+                if self.stream_script:
+                    stream = (self.director.stream_ensemble_scene if self.stage_mode == 'ensemble'
+                              else self.director.stream_turn_instructions)
+                    script_json = ScriptFeed(stream(self.context, outline.get('new_outline', outline), self.plot_failure_reason, self.plot_objectives[self.current_objective_index], priority=self.turn_priority))
+                    self.script_feed = script_json
+                    if self.cancellation_event.is_set() or gen != self._gen:
+                        script_json.close()
+                elif self.stage_mode == 'ensemble':
+                    script_json = self.director.generate_ensemble_scene(self.context, outline.get('new_outline', outline), self.plot_failure_reason, self.plot_objectives[self.current_objective_index], priority=self.turn_priority)
+                else:
+                    script_json = self.director.generate_turn_instructions(self.context, outline.get('new_outline', outline), self.plot_failure_reason,self.plot_objectives[self.current_objective_index], priority=self.turn_priority)
 
             # process script
             self.emit_event('director_status', {"status": "idle", "message": ""}, gen)
-            dialogue_lines = self.process_director_script(script_json, gen)
+            with self._span('script', gen) as span:
+                dialogue_lines = self.process_director_script(script_json, gen)
+                span['attributes']['lines'] = len(dialogue_lines)
+            if isinstance(script_json, ScriptFeed):
+                # stop draining a script the stage walked away from
+                script_json.close()
+                if self.script_feed is script_json:
+                    self.script_feed = None
 
             if self.cancellation_event.is_set() or gen != self._gen:
                 return dialogue_lines
 
-            # check player achievements using director.detect_achievements in the background using threading
-            def check_player_achievements():
-                detected_achievements = self.director.detect_achievements(self.context, self.player.name, self.achievements)
-                detected_achievements = detected_achievements.get('achievements', [])
-                # Track newly added achievements to avoid duplicates
-                new_achievements = []
-                
-                for achievement in detected_achievements:
-                    # Skip if this achievement title is already in self.achievements
-                    if any(existing.get('title') == achievement['title'] for existing in self.achievements):
-                        continue
-                        
-                    # Add to database and local list
-                    db.add_achievement(self.chat_id, achievement['title'], achievement['score'])
-                    self.achievements.append(achievement)
-                    new_achievements.append(achievement)
-                
-                # Only emit events for truly new achievements
-                for achievement in new_achievements:
-                    self.emit_event('achievement', achievement, self._gen)
-
-            threading.Thread(target=check_player_achievements, daemon=True).start()
-
-            # check objective
+            # queue achievement detection as a durable background job, once per turn
+            if self.chat_id:
+                job_queue.enqueue('detect_achievements', {
+                    'chat_id': self.chat_id, 'user_id': self.user_id, 'show': self.show,
+                    'description': self.description, 'background': self.background, 'relations': self.relations,
+                    'characters': dict(self.characters), 'player_name': self.player.name,
+                    'player_description': self.player.description, 'chat_history': self.context.render(),
+                    'achievements': self.achievements,
+                }, dedup_key=f"achievements:{self.chat_id}:{self.messages.next_sequence}")
+
+            # check objective while the next objective's outline is written speculatively
             self.emit_event('director_status', {"status": "directing", "message": "Checking objective completion..."}, gen)
-            check_str = self.director.check_objective(self.context, self.plot_objectives[self.current_objective_index])
+            speculative = self._speculate_next_outline(gen)
+            with self._span('objective_check', gen) as span:
+                check_str = self.director.check_objective(self.context, self.plot_objectives[self.current_objective_index])
+                span['attributes']['completed'] = bool(check_str.get('completed', False))
             self.emit_event('director_status', {"status": "idle", "message": ""}, gen)
             check = check_str
             completed = check.get('completed', False)
@@ -411,8 +830,11 @@ class Stage:
                 self.plot_failure_reason = ''
                 self.current_objective_index += 1
                 self.story_completed = (self.current_objective_index == len(self.plot_objectives))
+                self.speculative_outline = speculative
             else:
                 self.plot_failure_reason = check.get('reason', '')
+                if speculative:
+                    speculative['future'].cancel()
 
             objective_status = {
                 "completed": completed,
@@ -424,7 +846,7 @@ class Stage:
                 "story_completed": self.story_completed
             }
             self.emit_event('objective_status', objective_status, gen)
-            self.save_state_to_db()
+            self.save_state_to_db(strong=True)
 
             result = {
                 "status": "success",
@@ -449,9 +871,7 @@ class Stage:
             if (self.current_objective_index < len(self.plot_objectives)
                     and not self.cancellation_event.is_set()
                     and gen == self._gen):
-                self.next_turn_timer = threading.Timer(0.1, self.trigger_next_turn)
-                self.next_turn_timer.daemon = True
-                self.next_turn_timer.start()
+                self.next_turn_timer = stage_runtime.call_later(0.1, self.trigger_next_turn)
 
     def player_interrupt(self, player_input):
         """Handle player interruption and trigger an immediate response"""
@@ -461,18 +881,22 @@ class Stage:
         self._gen += 1
         # cancel old work
         self._cancel_all_operations()
+        # lines the player has not seen yet never happened
+        self._retract_unseen_lines()
         # clear any lingering cancel flag
         self.cancellation_event.clear()
         self.player_interrupted = True
 
         # record player input
+        self.last_active_at = time.time()
         player_name = self.player.name
         entry = {"role": player_name, "content": player_input, "type": "player_input"}
-        self.context = f"{self.context}\n{player_name}: {player_input}" if self.context else f"{player_name}: {player_input}"
+        self.context.append(player_name, player_input)
         self.dialogue_history.append(entry)
         if self.chat_id:
             try:
-                db.add_message(self.chat_id, player_name, player_input, "player_input", len(self.dialogue_history) - 1)
+                self.messages.add(player_name, player_input, "player_input")
+                self.messages.flush_async()
                 self.save_state_to_db()
             except Exception as e:
                 print(f"Error saving player input: {str(e)}")
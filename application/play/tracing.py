@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from application.utils.serialization import dumps_bytes
+
+# Finished spans kept in memory per worker for the chat timeline API
+TRACE_MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', '50000'))
+# Extra exporters besides the in-memory ring buffer: comma-separated 'jsonl' and/or 'otlp'
+TRACE_EXPORTERS = [name.strip() for name in os.getenv('TRACE_EXPORTERS', '').split(',') if name.strip()]
+# Files the jsonl and otlp exporters append to
+TRACE_JSONL_PATH = os.getenv('TRACE_JSONL_PATH', 'traces.jsonl')
+TRACE_OTLP_PATH = os.getenv('TRACE_OTLP_PATH', 'traces.otlp.jsonl')
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'ai-tv-stage')
+
+
+class RingBufferExporter:
+    """Keeps the most recent spans in memory so a chat's timeline can be queried"""
+    def __init__(self, max_spans=TRACE_MAX_SPANS):
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def for_chat(self, chat_id, limit=None):
+        """Spans of a chat, oldest first; with limit, only the spans of its last `limit` traces"""
+        with self._lock:
+            spans = [s for s in self.spans if s['chat_id'] == chat_id]
+        if limit:
+            traces = list(dict.fromkeys(s['trace_id'] for s in reversed(spans)))[:limit]
+            spans = [s for s in spans if s['trace_id'] in traces]
+        return spans
+
+
+class JsonlExporter:
+    """Appends each span as one JSON line"""
+    def __init__(self, path=TRACE_JSONL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = dumps_bytes(span) + b'\n'
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(line)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class OtlpJsonExporter(JsonlExporter):
+    """
+    Appends each span as an OTLP/JSON ExportTraceServiceRequest line, the format read by the
+    OpenTelemetry Collector's otlpjsonfile receiver.
+    """
+    def __init__(self, path=TRACE_OTLP_PATH, service_name=TRACE_SERVICE_NAME):
+        super().__init__(path)
+        self.service_name = service_name
+
+    def export(self, span):
+        attributes = {'chat.id': span['chat_id'], 'stage.generation': span['generation'],
+                      'stage.objective_index': span['objective_index'], **span['attributes']}
+        otlp_span = {
+            'traceId': span['trace_id'],
+            'spanId': span['span_id'],
+            'name': span['name'],
+            'kind': 1,
+            'startTimeUnixNano': str(int(span['start'] * 1e9)),
+            'endTimeUnixNano': str(int(span['end'] * 1e9)),
+            'attributes': _otlp_attributes(attributes),
+            'events': [{'timeUnixNano': str(int(event['time'] * 1e9)), 'name': event['name'],
+                        'attributes': _otlp_attributes(event['attributes'])} for event in span['events']],
+            'status': {'code': 2, 'message': span['error']} if span['error'] else {'code': 1},
+        }
+        if span['parent_id']:
+            otlp_span['parentSpanId'] = span['parent_id']
+        super().export({'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': self.service_name})},
+            'scopeSpans': [{'scope': {'name': 'application.play.stage'}, 'spans': [otlp_span]}],
+        }]})
+
+
+EXPORTERS = {'jsonl': JsonlExporter, 'otlp': OtlpJsonExporter}
+
+
+class Tracer:
+    """
+    Span tracing for the stage engine. span() times a block and nests under the span open on
+    the same thread, so a turn becomes one trace: outline, script, each line (generation,
+    pacing, writes), objective check and state saves. Spans carry the chat, generation and
+    objective index; event() records instantaneous events such as emits on the open span.
+    Finished spans go to the ring buffer and any configured exporters.
+    """
+    def __init__(self, exporters=None):
+        self.buffer = RingBufferExporter()
+        self.exporters = [self.buffer] + list(exporters or [])
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, chat_id=None, generation=None, objective_index=None, **attributes):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = {
+            'name': name,
+            'trace_id': parent['trace_id'] if parent else uuid.uuid4().hex,
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': parent['span_id'] if parent else None,
+            'chat_id': chat_id if chat_id is not None else (parent or {}).get('chat_id'),
+            'generation': generation if generation is not None else (parent or {}).get('generation'),
+            'objective_index': (objective_index if objective_index is not None
+                                else (parent or {}).get('objective_index')),
+            'attributes': attributes,
+            'events': [],
+            'error': None,
+            'start': time.time(),
+        }
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = str(e)
+            raise
+        finally:
+            stack.pop()
+            span['end'] = time.time()
+            span['duration'] = span['end'] - span['start']
+            self._export(span)
+
+    def event(self, name, **attributes):
+        """Record an event on the span open on this thread, if any"""
+        stack = self._stack()
+        if stack:
+            stack[-1]['events'].append({'name': name, 'time': time.time(), 'attributes': attributes})
+
+    def _export(self, span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"Error exporting span {span['name']}: {str(e)}")
+
+    def timeline(self, chat_id, limit=None):
+        """Recent spans of a chat with their start offsets from the first one, oldest first"""
+        spans = self.buffer.for_chat(chat_id, limit)
+        origin = spans[0]['start'] if spans else 0
+        return [{**span, 'offset': span['start'] - origin} for span in sorted(spans, key=lambda s: s['start'])]
+
+
+stage_tracer = Tracer([EXPORTERS[name]() for name in TRACE_EXPORTERS if name in EXPORTERS])
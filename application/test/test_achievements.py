@@ -0,0 +1,46 @@
+import json
+import application.ai.fake as fake
+import application.play.stage as stage
+
+
+class FakeDB:
+    def __init__(self, stored):
+        self.stored = list(stored)
+        self.added = []
+
+    def get_achievements(self, chat_id=None, user_id=None):
+        return self.stored
+
+    def add_achievement(self, chat_id, title, score):
+        self.added.append((chat_id, title, score))
+        self.stored.append({'chat_id': chat_id, 'title': title, 'score': score})
+
+
+PAYLOAD = {
+    'chat_id': 'chat-1', 'user_id': 'user-1', 'show': 'Harbor Lights', 'description': 'A seaside drama',
+    'background': 'The storm has passed.', 'relations': 'Old friends', 'characters': {'mara': 'The lighthouse keeper'},
+    'player_name': 'Sam', 'player_description': 'A returning sailor',
+    'chat_history': 'Sam: I rowed back through the storm.\nmara: You came back!', 'achievements': [],
+}
+
+
+def test_detect_player_achievements_stores_only_new_titles(monkeypatch):
+    reply = {'achievements': [{'title': 'Storm Rower', 'reason': 'Braved the storm', 'score': 4},
+                              {'title': 'Homecoming', 'reason': 'Returned to the harbor', 'score': 2}],
+             'confidence': 0.95}
+    monkeypatch.setattr(fake, 'respond', lambda messages: json.dumps(reply))
+    db = FakeDB([{'chat_id': 'chat-1', 'title': 'Homecoming', 'score': 2}])
+    monkeypatch.setattr(stage, 'db', db)
+
+    new_achievements = stage.detect_player_achievements(PAYLOAD)
+
+    assert [a['title'] for a in new_achievements] == ['Storm Rower']
+    assert db.added == [('chat-1', 'Storm Rower', 4)]
+
+
+def test_detect_player_achievements_accepts_jobs_queued_without_player_description(monkeypatch):
+    monkeypatch.setattr(fake, 'respond', lambda messages: json.dumps({'achievements': [], 'confidence': 0.9}))
+    monkeypatch.setattr(stage, 'db', FakeDB([]))
+    payload = {key: value for key, value in PAYLOAD.items() if key not in ('player_description', 'characters')}
+
+    assert stage.detect_player_achievements(payload) == []
@@ -0,0 +1,98 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from types import SimpleNamespace
+import application.auth.auth as auth
+
+SECRET = 's3cret'
+
+
+def _segment(data):
+    raw = data if isinstance(data, bytes) else json.dumps(data).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def make_token(claims=None, header=None, secret=SECRET):
+    header = {'alg': 'HS256', 'typ': 'JWT'} if header is None else header
+    claims = {'sub': 'user-1', 'email': 'sam@example.com', 'aud': 'authenticated',
+              'exp': int(time.time()) + 3600, **(claims or {})}
+    signing_input = f"{_segment(header)}.{_segment(claims)}"
+    signature = hmac.new(secret.encode('utf-8'), signing_input.encode('ascii'), hashlib.sha256).digest()
+    return f"{signing_input}.{_segment(signature)}"
+
+
+class FakeAuth:
+    def __init__(self):
+        self.calls = 0
+
+    def get_user(self, token):
+        self.calls += 1
+        raise Exception('remote verification should not be needed')
+
+
+def verifier(monkeypatch, max_size=10):
+    remote = FakeAuth()
+    monkeypatch.setattr(auth, 'supabase', SimpleNamespace(auth=remote))
+    return auth.TokenVerifier(secret=SECRET, jwks_url=None, max_size=max_size), remote
+
+
+def test_valid_hs256_token(monkeypatch):
+    tokens, remote = verifier(monkeypatch)
+    user = tokens.verify(make_token())
+    assert user['id'] == 'user-1'
+    assert user['email'] == 'sam@example.com'
+    assert tokens.stats['local'] == 1
+    assert remote.calls == 0
+
+
+def test_bad_signature_is_rejected(monkeypatch):
+    tokens, _ = verifier(monkeypatch)
+    assert tokens.verify(make_token(secret='wrong')) is None
+    assert tokens.stats['rejected'] == 1
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    tokens, _ = verifier(monkeypatch)
+    assert tokens.verify(make_token({'exp': int(time.time()) - auth.AUTH_CLOCK_SKEW - 60})) is None
+    assert tokens.verify(make_token({'exp': 'never'})) is None
+
+
+def test_wrong_audience_is_rejected(monkeypatch):
+    tokens, _ = verifier(monkeypatch)
+    assert tokens.verify(make_token({'aud': 'someone-else'})) is None
+    assert tokens.verify(make_token({'aud': ['someone-else', 'authenticated']}))['id'] == 'user-1'
+
+
+def test_malformed_tokens_are_rejected(monkeypatch):
+    tokens, remote = verifier(monkeypatch)
+    valid = make_token()
+    header_segment, payload_segment, signature_segment = valid.split('.')
+    for token in ('not-a-token', 'a.b', '!!!.@@@.###', f"W10.{payload_segment}.{signature_segment}",
+                  f"{header_segment}.W10.{signature_segment}", make_token(header=[]), valid + '.extra'):
+        assert tokens.verify(token) is None, token
+    assert remote.calls == 0
+
+
+def test_cache_hit_skips_verification(monkeypatch):
+    tokens, _ = verifier(monkeypatch)
+    token = make_token()
+    first = tokens.verify(token)
+    monkeypatch.setattr(tokens, '_verify_locally', lambda token, now: None)
+    assert tokens.verify(token) == first
+    assert tokens.stats['hits'] == 1
+    assert tokens.stats['local'] == 1
+
+
+def test_least_recently_used_token_is_evicted(monkeypatch):
+    tokens, _ = verifier(monkeypatch, max_size=2)
+    first, second, third = (make_token({'sub': f"user-{n}"}) for n in (1, 2, 3))
+    tokens.verify(first)
+    tokens.verify(second)
+    tokens.verify(first)
+    tokens.verify(third)
+    assert tokens.verify(first)['id'] == 'user-1'
+    assert tokens.stats['hits'] == 2
+    tokens.verify(second)
+    assert tokens.stats['local'] == 4
@@ -0,0 +1,76 @@
+import json
+import os
+from flask import make_response
+from flask.json.provider import DefaultJSONProvider
+
+# orjson serializes several times faster than the stdlib and writes bytes directly
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 'orjson' or 'json'; falls back to the stdlib when orjson is not installed
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'orjson').lower()
+
+_fast = orjson is not None and JSON_BACKEND == 'orjson'
+# datetimes are left to Flask's default so responses keep their format
+_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+
+def _default(obj):
+    return DefaultJSONProvider.default(obj)
+
+
+def dumps_bytes(obj):
+    """Compact UTF-8 JSON"""
+    if _fast:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj):
+    """Compact JSON text"""
+    if _fast:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode('utf-8')
+    return json.dumps(obj, default=_default, separators=(',', ':'))
+
+
+def loads(data):
+    """Parse JSON text or bytes; raises json.JSONDecodeError (orjson's error is a subclass)"""
+    if _fast:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider for jsonify: responses are encoded straight to bytes, without the
+    intermediate str copy, and request bodies are parsed with the same backend"""
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def output_json(data, code, headers=None):
+    """flask_restful representation for application/json, for resources returning plain dicts"""
+    response = make_response(dumps_bytes(data), code)
+    response.headers.extend(headers or {})
+    return response
+
+
+class socketio_json:
+    """json-module stand-in for Socket.IO packet encoding (SocketIO(json=...))"""
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return dumps(obj)
+
+    @staticmethod
+    def loads(data, **kwargs):
+        return loads(data)